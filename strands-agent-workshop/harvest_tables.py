@@ -0,0 +1,173 @@
+import os
+import re
+import sqlite3
+import threading
+from pdf_extraction import pdf_to_markdown
+
+# Harvest tables - every numeric cell of the tables in the uploaded reports, keyed by
+# state/animal/year, in a local SQLite database. Numeric questions (success rates, harvest
+# totals by unit and year) become one indexed query instead of retrieving chunks and having
+# the model read tables out of them.
+HARVEST_DB_PATH = os.environ.get('HARVEST_DB_PATH', os.path.join(os.path.expanduser('~'), '.strands_harvest_tables.sqlite'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    kb_id TEXT NOT NULL,
+    document TEXT NOT NULL,
+    state TEXT,
+    animal TEXT,
+    year INTEGER,
+    table_no INTEGER,
+    row_no INTEGER,
+    label TEXT,
+    measure TEXT,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS cells_topic ON cells (state, animal, year, measure);
+CREATE INDEX IF NOT EXISTS cells_document ON cells (kb_id, document);
+"""
+
+AGGREGATES = {'sum': 'SUM', 'avg': 'AVG', 'min': 'MIN', 'max': 'MAX', 'count': 'COUNT'}
+GROUP_COLUMNS = ('state', 'animal', 'year', 'label', 'measure', 'document')
+
+NUMBER = re.compile(r'^[-+]?\d+(?:\.\d+)?$')
+YEAR = re.compile(r'^(19|20)\d\d$')
+
+def measure_name(header):
+    """'Success %' -> 'success', 'Hunters Afield' -> 'hunters_afield'"""
+    return re.sub(r'[^a-z0-9]+', '_', header.lower()).strip('_')
+
+def parse_number(text):
+    """1234.0 for '1234', '1,234', '$1,234' or '1234%'; None if the cell isn't a number"""
+    text = text.strip().replace(',', '').lstrip('$').rstrip('%').strip()
+    return float(text) if NUMBER.match(text) else None
+
+def _is_header(row):
+    # Column headers name their column (or are years); numbers or blanks mean the header row is
+    # missing and the first row is body
+    return all(cell and (parse_number(cell) is None or YEAR.match(cell)) for cell in row[1:])
+
+def well_formed(rows):
+    """A header row distinct from the body and the same number of cells in every row"""
+    return len(rows) >= 2 and len({len(row) for row in rows}) == 1 and _is_header(rows[0])
+
+def markdown_tables(text):
+    """[[row cells]] for every well-formed markdown table in text, header row first"""
+    tables, rows = [], []
+    for line in text.splitlines() + ['']:
+        line = line.strip()
+        if line.startswith('|'):
+            cells = [cell.strip() for cell in line.strip('|').split('|')]
+            if not all(set(cell) <= set('-: ') for cell in cells):
+                rows.append(cells)
+            continue
+        if well_formed(rows):
+            tables.append(rows)
+        rows = []
+    return tables
+
+def table_cells(rows):
+    """(row_no, label, measure, value) for every numeric cell; the first column labels the row"""
+    header = [measure_name(cell) or f"column_{i}" for i, cell in enumerate(rows[0])]
+    for row_no, row in enumerate(rows[1:], 1):
+        for measure, cell in zip(header[1:], row[1:]):
+            value = parse_number(cell)
+            if value is not None:
+                yield row_no, row[0], measure, value
+
+def document_tables(source):
+    if source.lower().endswith('.pdf'):
+        return markdown_tables(pdf_to_markdown(source))
+    with open(source, encoding='utf-8', errors='ignore') as f:
+        return markdown_tables(f.read())
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def _connect(path):
+    connection = _connections.get(path)
+    if connection is None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = _connections[path] = sqlite3.connect(path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SCHEMA)
+    return connection
+
+def store_tables(kb_id, documents, removed=(), replace_all=False, path=HARVEST_DB_PATH):
+    """Replace a KB's cells for (source, target, attributes) documents; returns the number of cells stored"""
+    documents = list(documents)
+    rows = []
+    for source, target, attributes in documents:
+        for table_no, table in enumerate(document_tables(source)):
+            rows.extend((kb_id, target, attributes.get('state'), attributes.get('animal'), attributes.get('year'),
+                         table_no, row_no, label, measure, value)
+                        for row_no, label, measure, value in table_cells(table))
+    with _connections_lock:
+        connection = _connect(path)
+        with connection:
+            if replace_all:
+                connection.execute("DELETE FROM cells WHERE kb_id = ?", (kb_id,))
+            else:
+                connection.executemany("DELETE FROM cells WHERE kb_id = ? AND document = ?",
+                                       [(kb_id, target) for target in {t for _, t, _ in documents} | set(removed)])
+            connection.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+def _where(kb_id=None, state=None, animal=None, year=None, measure=None, label=None):
+    clauses, params = [], []
+    for column, value in (('kb_id', kb_id), ('state', state), ('animal', animal)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value.lower() if column != 'kb_id' else value)
+    if year is not None:
+        years = list(year) if isinstance(year, (list, tuple, set)) else [year]
+        clauses.append(f"year IN ({', '.join('?' * len(years))})")
+        params.extend(int(y) for y in years)
+    if measure:
+        clauses.append("measure LIKE ?")
+        params.append(f"%{measure_name(measure)}%")
+    if label:
+        clauses.append("label LIKE ?")
+        params.append(f"%{label}%")
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def query_tables(state=None, animal=None, year=None, measure=None, label=None, aggregate=None, group_by=(),
+                 kb_id=None, limit=50, path=HARVEST_DB_PATH):
+    """Matching cells as dicts, or aggregate ('sum', 'avg', 'min', 'max', 'count') of their values per group_by
+
+    measure and label match by substring (measure 'success' finds 'success_rate', label 'unit 3'
+    finds 'Unit 3 North'); year can be a list of years.
+    """
+    where, params = _where(kb_id, state, animal, year, measure, label)
+    if aggregate:
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate {aggregate!r}, expected one of {', '.join(AGGREGATES)}")
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+        unknown = set(group_by) - set(GROUP_COLUMNS)
+        if unknown:
+            raise ValueError(f"Can't group by {', '.join(sorted(unknown))}, expected some of {', '.join(GROUP_COLUMNS)}")
+        columns = ', '.join(group_by)
+        sql = (f"SELECT {columns + ', ' if columns else ''}{AGGREGATES[aggregate]}(value) AS {aggregate}, "
+               f"COUNT(*) AS cells FROM cells{where}"
+               + (f" GROUP BY {columns} ORDER BY {columns}" if columns else ""))
+    else:
+        sql = (f"SELECT state, animal, year, label, measure, value, document FROM cells{where} "
+               f"ORDER BY year, state, animal, document, table_no, row_no")
+    with _connections_lock:
+        return [dict(row) for row in _connect(path).execute(f"{sql} LIMIT ?", params + [limit])]
+
+def table_measures(state=None, animal=None, year=None, kb_id=None, path=HARVEST_DB_PATH):
+    """{measure: cell count} of what is stored for the given filters"""
+    where, params = _where(kb_id, state, animal, year)
+    with _connections_lock:
+        rows = _connect(path).execute(f"SELECT measure, COUNT(*) FROM cells{where} GROUP BY measure ORDER BY 2 DESC", params)
+        return dict(rows.fetchall())
+
+def drop_tables(kb_id, path=HARVEST_DB_PATH):
+    if not os.path.exists(path):
+        return
+    with _connections_lock:
+        connection = _connect(path)
+        with connection:
+            connection.execute("DELETE FROM cells WHERE kb_id = ?", (kb_id,))
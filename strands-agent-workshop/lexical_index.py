@@ -0,0 +1,158 @@
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+
+# Lexical index - BM25 over chunk text with a compact inverted index (one typed array of chunk ids
+# and one of term frequencies per term). Harvest reports are full of exact tokens (unit numbers,
+# hunt codes, years) that embeddings rank poorly; knowledge_base_management.hybrid_query_knowledge_base
+# merges these scores with the vector scores. Also home to the text helpers every local index shares.
+LEXICAL_INDEX_DIR = os.environ.get('LEXICAL_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.strands_lexical_index'))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'-][a-z0-9]+)*")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def extract_text(path):
+    """Plain text of a document; PDFs need pypdf"""
+    if path.lower().endswith('.pdf'):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ImportError("Reading PDFs into a local index requires pypdf (pip install pypdf)")
+        return '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+def chunk_text(text, chunk_words=300, overlap_words=50):
+    words = text.split()
+    step = max(1, chunk_words - overlap_words)
+    return [' '.join(words[i:i + chunk_words]) for i in range(0, max(len(words) - overlap_words, 1), step)
+            if words[i:i + chunk_words]]
+
+def matches_filter(metadata, filters):
+    """Evaluate a Bedrock retrieval filter (equals/notEquals/in/andAll/orAll) against chunk metadata"""
+    if not filters:
+        return True
+    if 'andAll' in filters:
+        return all(matches_filter(metadata, f) for f in filters['andAll'])
+    if 'orAll' in filters:
+        return any(matches_filter(metadata, f) for f in filters['orAll'])
+    if 'equals' in filters:
+        return metadata.get(filters['equals']['key']) == filters['equals']['value']
+    if 'notEquals' in filters:
+        return metadata.get(filters['notEquals']['key']) != filters['notEquals']['value']
+    if 'in' in filters:
+        return metadata.get(filters['in']['key']) in filters['in']['value']
+    raise ValueError(f"Unsupported filter for a local index: {filters}")
+
+class BM25Index:
+    """Okapi BM25 over a list of chunks ({'target', 'text', 'metadata'}), rebuilt on every change"""
+    def __init__(self, chunks=(), k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks = list(chunks)
+        self._build()
+
+    def _build(self):
+        terms = {}      # term -> (chunk ids, frequencies)
+        self.lengths = array('I')
+        for chunk_id, chunk in enumerate(self.chunks):
+            counts = {}
+            for token in tokenize(chunk['text']):
+                counts[token] = counts.get(token, 0) + 1
+            self.lengths.append(sum(counts.values()))
+            for token, count in counts.items():
+                postings = terms.get(token)
+                if postings is None:
+                    postings = terms[token] = (array('I'), array('H'))
+                postings[0].append(chunk_id)
+                postings[1].append(min(count, 65535))
+        self.postings = terms
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def idf(self, term):
+        postings = self.postings.get(term)
+        df = len(postings[0]) if postings else 0
+        return math.log(1 + (len(self.chunks) - df + 0.5) / (df + 0.5))
+
+    def _term_score(self, idf, tf, length):
+        norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def search(self, query, top_k=10, filters=None):
+        """[(score, chunk)] for the best-matching chunks, highest first"""
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            idf = self.idf(term)
+            for chunk_id, tf in zip(postings[0], postings[1]):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + self._term_score(idf, tf, self.lengths[chunk_id])
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for chunk_id, score in ranked:
+            chunk = self.chunks[chunk_id]
+            if matches_filter(chunk.get('metadata', {}), filters):
+                results.append((score, chunk))
+                if len(results) == top_k:
+                    break
+        return results
+
+    def score(self, query, texts):
+        """BM25 scores of arbitrary texts (e.g. retrieved chunks) using this corpus' statistics"""
+        terms = {term: self.idf(term) for term in set(tokenize(query))}
+        scores = []
+        for text in texts:
+            counts = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                if token in terms:
+                    counts[token] = counts.get(token, 0) + 1
+            scores.append(sum(self._term_score(terms[term], tf, len(tokens)) for term, tf in counts.items()))
+        return scores
+
+    def replace(self, chunks_by_target, removed=()):
+        """New index with the chunks of the given targets replaced and removed targets dropped"""
+        drop = set(chunks_by_target) | set(removed)
+        kept = [chunk for chunk in self.chunks if chunk['target'] not in drop]
+        return BM25Index(kept + [chunk for chunks in chunks_by_target.values() for chunk in chunks], self.k1, self.b)
+
+def document_chunks(source, target, metadata=None, uri=None):
+    return [{'target': target, 'text': text, 'uri': uri or target, 'metadata': dict(metadata or {})}
+            for text in chunk_text(extract_text(source))]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _index_path(kb_id, root):
+    return os.path.join(root, f"{kb_id}.pkl")
+
+def get_lexical_index(kb_id, root=LEXICAL_INDEX_DIR):
+    """The BM25Index for a knowledge base, or None if none was built"""
+    with _indexes_lock:
+        index = _indexes.get(kb_id)
+        if index is None and os.path.exists(_index_path(kb_id, root)):
+            with open(_index_path(kb_id, root), 'rb') as f:
+                index = _indexes[kb_id] = BM25Index(pickle.load(f))
+        return index
+
+def save_lexical_index(kb_id, index, root=LEXICAL_INDEX_DIR):
+    os.makedirs(root, exist_ok=True)
+    tmp_path = _index_path(kb_id, root) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        # Only the chunks are stored; the postings are rebuilt when the index is loaded
+        pickle.dump(index.chunks, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, _index_path(kb_id, root))
+    with _indexes_lock:
+        _indexes[kb_id] = index
+
+def drop_lexical_index(kb_id, root=LEXICAL_INDEX_DIR):
+    with _indexes_lock:
+        _indexes.pop(kb_id, None)
+    if os.path.exists(_index_path(kb_id, root)):
+        os.remove(_index_path(kb_id, root))
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# PDF downloader - streams reports to disk over pooled connections, downloads many at once and
+# keeps a local cache keyed by URL so unchanged reports are revalidated (ETag / Last-Modified)
+# instead of fetched again. Results plug straight into the `files` list that
+# create_knowledge_base_with_s3_vectors / update_knowledge_base_with_s3_vectors expect.
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', 'pdf_cache')
+CHUNK_SIZE = 256 * 1024
+
+DownloadResult = namedtuple('DownloadResult', ['url', 'path', 'target', 'status', 'bytes', 'seconds', 'error'])
+
+def _safe_name(name):
+    return re.sub(r'[^A-Za-z0-9._-]+', '-', name).strip('-') or 'document'
+
+class PdfDownloader:
+    """Concurrent, conditional, streaming downloader with an on-disk cache"""
+    def __init__(self, cache_dir=PDF_CACHE_DIR, max_workers=8, timeout=60, session=None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = session or self._new_session(max_workers)
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    @staticmethod
+    def _new_session(max_workers):
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return {}
+        with open(self._index_path) as f:
+            return json.load(f)
+
+    def _save_index(self):
+        with self._lock:
+            tmp_path = self._index_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._index, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._index_path)
+
+    def _path_for(self, url, name):
+        url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        base = name or os.path.splitext(os.path.basename(url.split('?')[0]))[0]
+        return os.path.join(self.cache_dir, f"{url_hash}-{_safe_name(base)}.pdf")
+
+    def download(self, url, name=None, save_index=True):
+        """Fetch one URL into the cache; name (e.g. the report year) becomes the S3 target name"""
+        started = time.monotonic()
+        name = None if name is None else str(name)
+        path = self._path_for(url, name)
+        tmp_path = path + '.part'
+        target = f"{_safe_name(name)}.pdf" if name else os.path.basename(path).split('-', 1)[1]
+        with self._lock:
+            cached = self._index.get(url)
+        headers = {}
+        if cached and os.path.exists(cached['path']):
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        try:
+            with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304:
+                    return DownloadResult(url, cached['path'], target, 'not_modified', 0,
+                                          time.monotonic() - started, None)
+                response.raise_for_status()
+                size = 0
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self._index[url] = {
+                        'path': path,
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'size': size,
+                    }
+        except Exception as e:
+            # A partial file would only be overwritten by the next attempt, so don't leave it behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return DownloadResult(url, None, target, 'failed', 0, time.monotonic() - started, e)
+        if save_index:
+            self._save_index()
+        return DownloadResult(url, path, target, 'downloaded', size, time.monotonic() - started, None)
+
+    def download_many(self, urls):
+        """Download {name: url}, [(name, url)] or [url] concurrently; one DownloadResult per URL"""
+        if isinstance(urls, dict):
+            items = list(urls.items())
+        else:
+            items = [(None, item) if isinstance(item, str) else tuple(item) for item in urls]
+        if not items:
+            return []
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(items)))) as pool:
+            futures = [pool.submit(self.download, url, name, False) for name, url in items]
+            results = [future.result() for future in futures]
+        self._save_index()
+
+        downloaded = [r for r in results if r.status == 'downloaded']
+        fresh = [r for r in results if r.status == 'not_modified']
+        failed = [r for r in results if r.status == 'failed']
+        total_mb = sum(r.bytes for r in downloaded) / (1024 * 1024)
+        print(f"✅ PDFs: {len(downloaded)} downloaded ({total_mb:.1f} MB), {len(fresh)} unchanged, "
+              f"{len(failed)} failed in {time.monotonic() - started:.1f}s")
+        for r in failed:
+            print(f"❌ Failed to download {r.url}: {r.error}")
+        return results
+
+def files_for_upload(results, prefix=''):
+    """(source, target) pairs for every PDF that is available locally
+
+    prefix places them in the animal/state/ folder the metadata is derived from, e.g. prefix='deer/utah/'
+    for deer/utah/2023.pdf.
+    """
+    return [(r.path, prefix + r.target) for r in results if r.path]
+
+def metadata_for_upload(results, prefix=''):
+    """{target: {'source_url': url}} for the knowledge base functions' metadata= argument"""
+    return {prefix + r.target: {'source_url': r.url} for r in results if r.path}
+
+_default_downloader = None
+_default_lock = threading.Lock()
+
+def get_downloader():
+    global _default_downloader
+    with _default_lock:
+        if _default_downloader is None:
+            _default_downloader = PdfDownloader()
+        return _default_downloader
+
+def download_pdfs(urls, prefix=''):
+    """Download reports concurrently and return the files list for the knowledge base functions"""
+    return files_for_upload(get_downloader().download_many(urls), prefix)
+
+def download_pdf(url, year):
+    """Drop-in replacement for the notebooks' download_pdf - returns the local file name or None"""
+    result = get_downloader().download(url, year)
+    if result.path:
+        print(f"PDF {'downloaded' if result.status == 'downloaded' else 'unchanged'}: {result.path}")
+        return result.path
+    print(f"Failed to download PDF: {result.error}")
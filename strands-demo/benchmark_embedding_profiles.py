@@ -0,0 +1,171 @@
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import knowledge_base_management as kbm
+from lexical_index import chunk_text, extract_text
+
+# Recall vs latency for each embedding profile on our own corpus. Chunks the documents the way the
+# knowledge base does, embeds them with every profile through Bedrock and runs the queries against
+# an exact in-memory index, so the numbers compare the vectors rather than the vector store:
+#
+#   python benchmark_embedding_profiles.py pdf_cache/ --queries queries.json --k 5
+#   python benchmark_embedding_profiles.py pdf_cache/ --profile titan-v2-1024 --profile titan-v2-256 --json
+#
+# queries.json is a list of {"query": "...", "relevant": ["2023.pdf", ...]} (relevant = the names the
+# documents are uploaded as - pdf_cache's <url hash>-2023.pdf counts as 2023.pdf). From Python,
+# benchmark(files) takes the same (source, target) pairs as the knowledge base functions and labels
+# chunks by target, e.g. "deer/utah/2023.pdf". Without queries, snippets of the corpus itself are
+# used as queries and recall is measured against the top-k of the largest profile.
+
+CACHE_PREFIX = re.compile(r'^[0-9a-f]{12}-')   # pdf_downloader's URL hash in front of the file name
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+class TitanEmbedder:
+    """Embeds texts with a profile's model and dimension via bedrock-runtime, timing every call"""
+    def __init__(self, profile, region="us-east-1", max_workers=8):
+        self.profile = profile
+        self.client = kbm.get_client('bedrock-runtime', region)
+        self.max_workers = max_workers
+        self.latencies = []
+
+    def embed_one(self, text):
+        started = time.monotonic()
+        response = self.client.invoke_model(
+            modelId=self.profile.model_id,
+            body=json.dumps({'inputText': text, 'dimensions': self.profile.dimension, 'normalize': True})
+        )
+        embedding = json.loads(response['body'].read())['embedding']
+        self.latencies.append(time.monotonic() - started)
+        return embedding
+
+    def embed(self, texts):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return np.array(list(pool.map(self.embed_one, texts)), dtype='float32')
+
+def document_label(path):
+    """The name a file is uploaded under: 2023.pdf for pdf_cache/<url hash>-2023.pdf"""
+    return CACHE_PREFIX.sub('', os.path.basename(path))
+
+def load_corpus(paths):
+    """[(document label, chunk text)] for every document under paths or (source, target) pair in them"""
+    files = []
+    for path in paths:
+        if isinstance(path, (tuple, list)):
+            files.append(tuple(path))
+        elif os.path.isdir(path):
+            files.extend((found, document_label(found))
+                         for found in sorted(glob.glob(os.path.join(path, '**', '*'), recursive=True)))
+        else:
+            files.append((path, document_label(path)))
+    chunks = []
+    for path, label in files:
+        if os.path.isfile(path) and not path.endswith(('.json', '.part', '.tmp')):
+            chunks.extend((label, text) for text in chunk_text(extract_text(path)))
+    return chunks
+
+def load_queries(path, chunks, sample, seed=0):
+    if path:
+        with open(path) as f:
+            return [q if isinstance(q, dict) else {'query': q} for q in json.load(f)]
+    # Pseudo-queries: the opening words of random chunks
+    rng = random.Random(seed)
+    picked = rng.sample(chunks, min(sample, len(chunks)))
+    return [{'query': ' '.join(text.split()[:20])} for _, text in picked]
+
+def search(vectors, query_vectors, k, metric):
+    if metric == 'euclidean':
+        scores = -((query_vectors[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+    else:
+        scores = query_vectors @ vectors.T
+    k = min(k, vectors.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+def run_profile(name, profile, chunks, queries, k, region):
+    embedder = TitanEmbedder(profile, region)
+    vectors = embedder.embed([text for _, text in chunks])
+    embedder.latencies = []
+    query_vectors = embedder.embed([q['query'] for q in queries])
+    started = time.monotonic()
+    hits = search(vectors, query_vectors, k, profile.distance_metric)
+    search_seconds = (time.monotonic() - started) / max(len(queries), 1)
+    return {
+        'profile': name,
+        'dimension': profile.dimension,
+        'hits': hits,
+        'query_embed_p50_ms': percentile(embedder.latencies, 50) * 1000,
+        'query_embed_p95_ms': percentile(embedder.latencies, 95) * 1000,
+        'search_ms': search_seconds * 1000,
+        'vector_storage_mb': vectors.nbytes / kbm.MB,
+    }
+
+def label_recall(hits, chunks, queries):
+    """Share of each query's relevant documents that show up in its top-k chunks"""
+    scores = []
+    for row, query in zip(hits, queries):
+        relevant = set(query.get('relevant', []))
+        if relevant:
+            found = {chunks[i][0] for i in row} & relevant
+            scores.append(len(found) / len(relevant))
+    return float(np.mean(scores)) if scores else None
+
+def overlap_recall(hits, reference):
+    """Share of the reference profile's top-k chunks this profile also returns"""
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(hits, reference)]))
+
+def benchmark(paths, profile_names=None, queries_path=None, k=5, sample=50, region="us-east-1"):
+    chunks = load_corpus(paths)
+    if not chunks:
+        raise ValueError(f"No documents found under {paths}")
+    queries = load_queries(queries_path, chunks, sample)
+    profiles = {name: kbm.EMBEDDING_PROFILES[name] for name in (profile_names or kbm.EMBEDDING_PROFILES)}
+    print(f"📚 {len(chunks)} chunks, {len(queries)} queries, {len(profiles)} profiles", file=sys.stderr)
+    results = [run_profile(name, profile, chunks, queries, k, region) for name, profile in profiles.items()]
+
+    labelled = any(q.get('relevant') for q in queries)
+    reference = max(results, key=lambda r: r['dimension'])['hits']
+    for r in results:
+        r[f'recall_at_{k}'] = (label_recall(r['hits'], chunks, queries) if labelled
+                               else overlap_recall(r['hits'], reference))
+        r['recall_basis'] = 'labels' if labelled else 'largest profile'
+        del r['hits']
+    return results
+
+def print_table(results, k):
+    print(f"{'Profile':<16} {'Dim':>5} {f'Recall@{k}':>9} {'Embed p50 ms':>13} {'Embed p95 ms':>13} {'Search ms':>10} {'Vectors MB':>11}")
+    for r in results:
+        print(f"{r['profile']:<16} {r['dimension']:>5} {r[f'recall_at_{k}']:>9.3f} {r['query_embed_p50_ms']:>13.1f} "
+              f"{r['query_embed_p95_ms']:>13.1f} {r['search_ms']:>10.3f} {r['vector_storage_mb']:>11.2f}")
+    if results:
+        print(f"Recall measured against {results[0]['recall_basis']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall@k and latency of each embedding profile on a local corpus")
+    parser.add_argument('paths', nargs='+', help="Documents or directories of documents (e.g. pdf_cache/)")
+    parser.add_argument('--profile', action='append', choices=sorted(kbm.EMBEDDING_PROFILES), help="Profiles to compare")
+    parser.add_argument('--queries', help="JSON list of {query, relevant} to score against")
+    parser.add_argument('--k', type=int, default=5, help="Chunks retrieved per query")
+    parser.add_argument('--sample', type=int, default=50, help="Pseudo-queries drawn from the corpus without --queries")
+    parser.add_argument('--region', default="us-east-1")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.paths, args.profile, args.queries, args.k, args.sample, args.region)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results, args.k)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,550 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from botocore.exceptions import ClientError
+import knowledge_base_management as kbm
+
+# Offline benchmark for provisioning and ingestion latency. Runs knowledge_base_management against
+# an in-memory fake of STS, S3, S3 Vectors, IAM and Bedrock Agent with configurable per-API
+# latency and a configurable number of polls before each resource reports ready, so it needs no
+# AWS account and runs on a plain Linux CI box:
+#
+#   python benchmark_knowledge_base.py                      # every scenario, table output
+#   python benchmark_knowledge_base.py --scenario noop_update --json
+#   python benchmark_knowledge_base.py --save baseline.json
+#   python benchmark_knowledge_base.py --baseline baseline.json --tolerance 0.25   # CI gate
+#
+# Waiter and ingestion-monitor sleeps are shrunk by --sleep-scale so a run takes seconds;
+# 'production_sleep_seconds' is what the same run would have slept against AWS. Sleep is summed
+# over threads, so with concurrent topics it can exceed the wall time.
+ACCOUNT_ID = '123456789012'
+
+def _error(code, message=None):
+    return ClientError({'Error': {'Code': code, 'Message': message or code}}, code)
+
+def _check_document_batch(documents):
+    # The document-level APIs take at most 10 documents; botocore doesn't check it, the service does
+    if len(documents) > 10:
+        raise _error('ValidationException', f"Member must have length less than or equal to 10, got {len(documents)}")
+
+class FakeAWS:
+    """Shared state of the fake account plus per-API call counters"""
+    def __init__(self, latency=0.002, api_latency=None, polls_before_ready=2, upload_mb_per_second=200.0):
+        self.latency = latency
+        self.api_latency = api_latency or {}
+        self.polls_before_ready = polls_before_ready
+        self.upload_mb_per_second = upload_mb_per_second
+        self.calls = {}
+        self.lock = threading.RLock()
+        self.buckets = {}          # bucket -> {key: metadata}
+        self.vector_buckets = {}   # name -> polls
+        self.indexes = {}          # (bucket, index) -> config
+        self.roles = {}            # name -> {'policy': ...}
+        self.kbs = {}              # kb_id -> record
+        self.data_sources = {}     # ds_id -> record
+        self.jobs = {}             # job_id -> polls
+        self.documents = {}        # s3 uri -> {'status', 'polls'}
+        self.ids = itertools.count(1)
+
+    def call(self, api):
+        with self.lock:
+            self.calls[api] = self.calls.get(api, 0) + 1
+        delay = self.api_latency.get(api, self.latency)
+        if delay:
+            time.sleep(delay)
+
+    def poll(self, record):
+        """Count a status poll; True once the resource has been polled polls_before_ready times"""
+        with self.lock:
+            record['polls'] = record.get('polls', 0) + 1
+            return record['polls'] > self.polls_before_ready
+
+    def client(self, service, region):
+        return SERVICES[service](self)
+
+class _FakeClient:
+    def __init__(self, aws):
+        self.aws = aws
+
+class _Paginator:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def paginate(self, **kwargs):
+        yield self.fn(**kwargs)
+
+class FakeSTS(_FakeClient):
+    def get_caller_identity(self):
+        self.aws.call('sts.get_caller_identity')
+        return {'Account': ACCOUNT_ID}
+
+class FakeS3(_FakeClient):
+    class exceptions:
+        class BucketAlreadyOwnedByYou(Exception):
+            pass
+
+    def create_bucket(self, Bucket, **kwargs):
+        self.aws.call('s3.create_bucket')
+        with self.aws.lock:
+            if Bucket in self.aws.buckets:
+                raise self.exceptions.BucketAlreadyOwnedByYou()
+            self.aws.buckets[Bucket] = {}
+
+    def upload_file(self, source, bucket, key, Config=None, Callback=None, ExtraArgs=None):
+        self.aws.call('s3.upload_file')
+        size = os.path.getsize(source)
+        time.sleep(size / kbm.MB / self.aws.upload_mb_per_second)
+        if Callback:
+            Callback(size)
+        with self.aws.lock:
+            self.aws.buckets.setdefault(bucket, {})[key] = dict((ExtraArgs or {}).get('Metadata', {}))
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.aws.call('s3.put_object')
+        with self.aws.lock:
+            self.aws.buckets.setdefault(Bucket, {})[Key] = {}
+
+    def get_paginator(self, name):
+        def list_objects_v2(Bucket):
+            self.aws.call('s3.list_objects_v2')
+            return {'Contents': [{'Key': key} for key in self.aws.buckets.get(Bucket, {})]}
+        return _Paginator(list_objects_v2)
+
+    def head_object(self, Bucket, Key):
+        self.aws.call('s3.head_object')
+        return {'Metadata': self.aws.buckets[Bucket][Key]}
+
+    def delete_objects(self, Bucket, Delete):
+        self.aws.call('s3.delete_objects')
+        with self.aws.lock:
+            for obj in Delete['Objects']:
+                self.aws.buckets[Bucket].pop(obj['Key'], None)
+
+class FakeS3Vectors(_FakeClient):
+    def create_vector_bucket(self, vectorBucketName, **kwargs):
+        self.aws.call('s3vectors.create_vector_bucket')
+        with self.aws.lock:
+            if vectorBucketName in self.aws.vector_buckets:
+                raise _error('ConflictException', 'Vector bucket already exists')
+            self.aws.vector_buckets[vectorBucketName] = {}
+
+    def get_vector_bucket(self, vectorBucketName):
+        self.aws.call('s3vectors.get_vector_bucket')
+        record = self.aws.vector_buckets.get(vectorBucketName)
+        if record is None or not self.aws.poll(record):
+            raise _error('NotFoundException')
+        return {'vectorBucket': {'vectorBucketName': vectorBucketName}}
+
+    def delete_vector_bucket(self, vectorBucketName):
+        self.aws.call('s3vectors.delete_vector_bucket')
+        with self.aws.lock:
+            if vectorBucketName not in self.aws.vector_buckets:
+                raise _error('NotFoundException')
+            if any(bucket == vectorBucketName for bucket, _ in self.aws.indexes):
+                raise _error('ConflictException', 'Vector bucket is not empty')
+            del self.aws.vector_buckets[vectorBucketName]
+
+    def create_index(self, vectorBucketName, indexName, **config):
+        self.aws.call('s3vectors.create_index')
+        with self.aws.lock:
+            if (vectorBucketName, indexName) in self.aws.indexes:
+                raise _error('ConflictException', 'Index already exists')
+            self.aws.indexes[(vectorBucketName, indexName)] = {'config': config}
+
+    def get_index(self, vectorBucketName, indexName):
+        self.aws.call('s3vectors.get_index')
+        record = self.aws.indexes.get((vectorBucketName, indexName))
+        if record is None or not self.aws.poll(record):
+            raise _error('NotFoundException')
+        return {'index': dict(record['config'], vectorBucketName=vectorBucketName, indexName=indexName)}
+
+    def delete_index(self, vectorBucketName, indexName):
+        self.aws.call('s3vectors.delete_index')
+        with self.aws.lock:
+            if self.aws.indexes.pop((vectorBucketName, indexName), None) is None:
+                raise _error('NotFoundException')
+
+class FakeIAM(_FakeClient):
+    class exceptions:
+        class EntityAlreadyExistsException(Exception):
+            pass
+
+    def create_role(self, RoleName, **kwargs):
+        self.aws.call('iam.create_role')
+        with self.aws.lock:
+            if RoleName in self.aws.roles:
+                raise self.exceptions.EntityAlreadyExistsException()
+            self.aws.roles[RoleName] = {'trust': kwargs.get('AssumeRolePolicyDocument')}
+        return {'Role': {'Arn': f"arn:aws:iam::{ACCOUNT_ID}:role/{RoleName}"}}
+
+    def put_role_policy(self, RoleName, PolicyName, PolicyDocument):
+        self.aws.call('iam.put_role_policy')
+        self.aws.roles[RoleName]['policy'] = PolicyDocument
+
+    def get_role(self, RoleName):
+        self.aws.call('iam.get_role')
+        if RoleName not in self.aws.roles:
+            raise _error('NoSuchEntity')
+        return {'Role': {'Arn': f"arn:aws:iam::{ACCOUNT_ID}:role/{RoleName}",
+                         'AssumeRolePolicyDocument': self.aws.roles[RoleName]['trust']}}
+
+    def update_assume_role_policy(self, RoleName, PolicyDocument):
+        self.aws.call('iam.update_assume_role_policy')
+        self.aws.roles[RoleName]['trust'] = PolicyDocument
+
+    def get_role_policy(self, RoleName, PolicyName):
+        self.aws.call('iam.get_role_policy')
+        record = self.aws.roles.get(RoleName, {})
+        if 'policy' not in record:
+            raise _error('NoSuchEntity')
+        return {'PolicyDocument': record['policy']}
+
+class FakeBedrockAgent(_FakeClient):
+    def get_paginator(self, name):
+        def list_knowledge_bases():
+            self.aws.call('bedrock-agent.list_knowledge_bases')
+            return {'knowledgeBaseSummaries': [{'name': kb['name'], 'knowledgeBaseId': kb_id}
+                                               for kb_id, kb in list(self.aws.kbs.items())]}
+
+        def list_data_sources(knowledgeBaseId):
+            self.aws.call('bedrock-agent.list_data_sources')
+            return {'dataSourceSummaries': [{'name': ds['name'], 'dataSourceId': ds_id}
+                                            for ds_id, ds in list(self.aws.data_sources.items())
+                                            if ds['knowledgeBaseId'] == knowledgeBaseId]}
+        return _Paginator(list_knowledge_bases if name == 'list_knowledge_bases' else list_data_sources)
+
+    def create_knowledge_base(self, name, **config):
+        self.aws.call('bedrock-agent.create_knowledge_base')
+        kb_id = f"KB{next(self.aws.ids):08d}"
+        with self.aws.lock:
+            self.aws.kbs[kb_id] = {'name': name, 'config': dict(config, name=name, knowledgeBaseId=kb_id)}
+        return {'knowledgeBase': {'knowledgeBaseId': kb_id}}
+
+    def get_knowledge_base(self, knowledgeBaseId):
+        self.aws.call('bedrock-agent.get_knowledge_base')
+        kb = self.aws.kbs.get(knowledgeBaseId)
+        if kb is None:
+            raise _error('ResourceNotFoundException')
+        if kb.get('deleting'):
+            if self.aws.poll(kb):
+                with self.aws.lock:
+                    self.aws.kbs.pop(knowledgeBaseId, None)
+                raise _error('ResourceNotFoundException')
+            return {'knowledgeBase': dict(kb['config'], status='DELETING')}
+        status = 'ACTIVE' if kb.get('active') or self.aws.poll(kb) else 'CREATING'
+        kb['active'] = status == 'ACTIVE'
+        return {'knowledgeBase': dict(kb['config'], status=status)}
+
+    def update_knowledge_base(self, knowledgeBaseId, **config):
+        self.aws.call('bedrock-agent.update_knowledge_base')
+        self.aws.kbs[knowledgeBaseId]['config'].update(config)
+        return {'knowledgeBase': dict(self.aws.kbs[knowledgeBaseId]['config'], status='UPDATING')}
+
+    def delete_knowledge_base(self, knowledgeBaseId):
+        self.aws.call('bedrock-agent.delete_knowledge_base')
+        kb = self.aws.kbs[knowledgeBaseId]
+        kb['deleting'], kb['polls'] = True, 0
+
+    def create_data_source(self, knowledgeBaseId, name, **config):
+        self.aws.call('bedrock-agent.create_data_source')
+        ds_id = f"DS{next(self.aws.ids):08d}"
+        with self.aws.lock:
+            self.aws.data_sources[ds_id] = dict(config, knowledgeBaseId=knowledgeBaseId, name=name)
+        return {'dataSource': {'dataSourceId': ds_id}}
+
+    def get_data_source(self, knowledgeBaseId, dataSourceId):
+        self.aws.call('bedrock-agent.get_data_source')
+        return {'dataSource': dict(self.aws.data_sources[dataSourceId], dataSourceId=dataSourceId)}
+
+    def update_data_source(self, knowledgeBaseId, dataSourceId, **config):
+        self.aws.call('bedrock-agent.update_data_source')
+        self.aws.data_sources[dataSourceId].update(config)
+        return {'dataSource': {'dataSourceId': dataSourceId}}
+
+    def start_ingestion_job(self, knowledgeBaseId, dataSourceId):
+        self.aws.call('bedrock-agent.start_ingestion_job')
+        job_id = f"JOB{next(self.aws.ids):08d}"
+        with self.aws.lock:
+            # Like Bedrock, one running ingestion job per knowledge base
+            if any(job['kb_id'] == knowledgeBaseId and not job.get('done') for job in self.aws.jobs.values()):
+                raise _error('ConflictException', 'An ingestion job is already running')
+            self.aws.jobs[job_id] = {'kb_id': knowledgeBaseId}
+        return {'ingestionJob': {'ingestionJobId': job_id, 'status': 'STARTING'}}
+
+    def get_ingestion_job(self, knowledgeBaseId, dataSourceId, ingestionJobId):
+        self.aws.call('bedrock-agent.get_ingestion_job')
+        job = self.aws.jobs[ingestionJobId]
+        job['done'] = job.get('done') or self.aws.poll(job)
+        status = 'COMPLETE' if job['done'] else 'IN_PROGRESS'
+        return {'ingestionJob': {'knowledgeBaseId': knowledgeBaseId, 'dataSourceId': dataSourceId,
+                                 'ingestionJobId': ingestionJobId, 'status': status}}
+
+    def _document_detail(self, knowledgeBaseId, dataSourceId, uri):
+        document = self.aws.documents.get(uri)
+        if document is None:
+            status = 'NOT_FOUND'
+        elif self.aws.poll(document):
+            status = document['done']
+            if status == 'NOT_FOUND':
+                self.aws.documents.pop(uri, None)
+        else:
+            status = 'IN_PROGRESS' if document['done'] == 'INDEXED' else 'DELETE_IN_PROGRESS'
+        return {'knowledgeBaseId': knowledgeBaseId, 'dataSourceId': dataSourceId, 'status': status,
+                'identifier': {'dataSourceType': 'S3', 's3': {'uri': uri}}}
+
+    def ingest_knowledge_base_documents(self, knowledgeBaseId, dataSourceId, documents):
+        self.aws.call('bedrock-agent.ingest_knowledge_base_documents')
+        _check_document_batch(documents)
+        uris = [document['content']['s3']['s3Location']['uri'] for document in documents]
+        with self.aws.lock:
+            for uri in uris:
+                self.aws.documents[uri] = {'done': 'INDEXED'}
+        return {'documentDetails': [dict(self._document_detail(knowledgeBaseId, dataSourceId, uri), status='STARTING')
+                                    for uri in uris]}
+
+    def delete_knowledge_base_documents(self, knowledgeBaseId, dataSourceId, documentIdentifiers):
+        self.aws.call('bedrock-agent.delete_knowledge_base_documents')
+        _check_document_batch(documentIdentifiers)
+        uris = [identifier['s3']['uri'] for identifier in documentIdentifiers]
+        with self.aws.lock:
+            for uri in uris:
+                self.aws.documents[uri] = {'done': 'NOT_FOUND'}
+        return {'documentDetails': [dict(self._document_detail(knowledgeBaseId, dataSourceId, uri), status='DELETING')
+                                    for uri in uris]}
+
+    def get_knowledge_base_documents(self, knowledgeBaseId, dataSourceId, documentIdentifiers):
+        self.aws.call('bedrock-agent.get_knowledge_base_documents')
+        _check_document_batch(documentIdentifiers)
+        return {'documentDetails': [self._document_detail(knowledgeBaseId, dataSourceId, identifier['s3']['uri'])
+                                    for identifier in documentIdentifiers]}
+
+SERVICES = {
+    'sts': FakeSTS,
+    's3': FakeS3,
+    's3vectors': FakeS3Vectors,
+    'iam': FakeIAM,
+    'bedrock-agent': FakeBedrockAgent,
+}
+
+class BenchmarkClock(kbm.Clock):
+    """Real time, but every requested sleep is shrunk by sleep_scale and accounted for"""
+    def __init__(self, sleep_scale=0.01):
+        self.sleep_scale = sleep_scale
+        self.requested = 0.0
+        self.slept = 0.0
+        self._lock = threading.Lock()
+
+    def _account(self, seconds):
+        with self._lock:
+            self.requested += seconds
+            self.slept += seconds * self.sleep_scale
+
+    def now(self):
+        # Time moves 1/sleep_scale faster so backoff schedules and deadlines keep their shape
+        return time.monotonic() / self.sleep_scale
+
+    def sleep(self, seconds):
+        self._account(seconds)
+        time.sleep(seconds * self.sleep_scale)
+
+    def wait(self, event, timeout):
+        started = time.monotonic()
+        result = event.wait(timeout * self.sleep_scale)
+        self._account((time.monotonic() - started) / self.sleep_scale)
+        return result
+
+def make_files(directory, count, size, first=0, partition='deer/utah'):
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for i in range(first, first + count):
+        path = os.path.join(directory, f"{partition.replace('/', '-')}-{i:04d}.pdf")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        files.append((path, f"{partition}/{i:04d}.pdf"))
+    return files
+
+# Every finished phase of the scenario being measured, for upload throughput
+_phase_events = []
+kbm.add_event_listener(_phase_events.append)
+
+def _upload_throughput(events, clock):
+    uploads = [e for e in events if e.phase == 'upload' and e.duration > 0]
+    seconds = max(e.started + e.duration for e in uploads) - min(e.started for e in uploads) if uploads else 0
+    # Phases are timed by the benchmark clock, which runs 1/sleep_scale faster than real time
+    seconds *= clock.sleep_scale
+    return sum(e.bytes_uploaded for e in uploads) / kbm.MB / seconds if seconds else 0.0
+
+def _reset(aws, clock):
+    """Forget the setup work so only the step under test is measured"""
+    aws.calls.clear()
+    clock.requested = clock.slept = 0.0
+    del _phase_events[:]
+
+def scenario_create(file_count):
+    def run(aws, clock, workdir, file_size):
+        files = make_files(workdir, file_count, file_size)
+        started = time.monotonic()
+        kbm.create_knowledge_base_with_s3_vectors('bench', files, clock=clock)
+        return started
+    return run
+
+def scenario_noop_update(aws, clock, workdir, file_size):
+    files = make_files(workdir, 50, file_size)
+    manifest_path = os.path.join(workdir, 'manifest.json')
+    kb_id = kbm.create_knowledge_base_with_s3_vectors('bench', files, clock=clock)
+    kbm.update_knowledge_base_with_s3_vectors('bench', files, kb_id, clock=clock, incremental=True,
+                                              manifest_path=manifest_path)
+    _reset(aws, clock)
+    started = time.monotonic()
+    kbm.update_knowledge_base_with_s3_vectors('bench', files, kb_id, clock=clock, incremental=True,
+                                              manifest_path=manifest_path)
+    return started
+
+def scenario_direct_update(aws, clock, workdir, file_size):
+    files = make_files(workdir, 50, file_size)
+    manifest_path = os.path.join(workdir, 'manifest.json')
+    kb_id = kbm.create_knowledge_base_with_s3_vectors('bench', files, clock=clock)
+    kbm.update_knowledge_base_with_s3_vectors('bench', files, kb_id, clock=clock, incremental=True,
+                                              manifest_path=manifest_path)
+    files += make_files(workdir, 1, file_size, first=len(files))
+    _reset(aws, clock)
+    started = time.monotonic()
+    kbm.update_knowledge_base_with_s3_vectors('bench', files, kb_id, clock=clock, direct=True,
+                                              manifest_path=manifest_path)
+    return started
+
+def scenario_partitioned_update(aws, clock, workdir, file_size):
+    # As many partitions as a KB can have data sources (kbm.MAX_PARTITIONS)
+    partitions = [f"{animal}/utah" for animal in ('deer', 'elk', 'moose', 'bear', 'bison')]
+    files = [f for partition in partitions for f in make_files(workdir, 10, file_size, partition=partition)]
+    manifest_path = os.path.join(workdir, 'manifest.json')
+    kb_id = kbm.create_knowledge_base_with_s3_vectors('bench', files, clock=clock, partitioned=True)
+    kbm.update_knowledge_base_with_s3_vectors('bench', files, kb_id, clock=clock, partitioned=True,
+                                              manifest_path=manifest_path)
+    files += make_files(workdir, 1, file_size, first=10, partition=partitions[0])
+    _reset(aws, clock)
+    started = time.monotonic()
+    kbm.update_knowledge_base_with_s3_vectors('bench', files, kb_id, clock=clock, partitioned=True,
+                                              manifest_path=manifest_path)
+    return started
+
+def scenario_reconcile_noop(aws, clock, workdir, file_size):
+    files = make_files(workdir, 50, file_size)
+    kbm.create_knowledge_base_with_s3_vectors('bench', files, clock=clock, reconcile=True)
+    _reset(aws, clock)
+    started = time.monotonic()
+    kbm.create_knowledge_base_with_s3_vectors('bench', files, clock=clock, reconcile=True)
+    return started
+
+def scenario_topics(topic_count):
+    def run(aws, clock, workdir, file_size):
+        specs = []
+        for i in range(topic_count):
+            specs.append((f"bench-{i}", make_files(os.path.join(workdir, f"topic-{i}"), 5, file_size)))
+        started = time.monotonic()
+        failed = [r for r in kbm.create_knowledge_bases(specs, clock=clock, max_concurrency=topic_count) if r.error]
+        if failed:
+            raise failed[0].error
+        return started
+    return run
+
+SCENARIOS = {
+    'create_1': scenario_create(1),
+    'create_50': scenario_create(50),
+    'create_500': scenario_create(500),
+    'noop_update': scenario_noop_update,
+    'direct_update': scenario_direct_update,
+    'partitioned_update': scenario_partitioned_update,
+    'reconcile_noop': scenario_reconcile_noop,
+    'topics_10': scenario_topics(10),
+}
+
+def run_scenario(name, latency=0.002, api_latency=None, polls_before_ready=2, sleep_scale=0.01,
+                 file_size=64 * 1024, upload_mb_per_second=200.0, verbose=False):
+    aws = FakeAWS(latency, api_latency, polls_before_ready, upload_mb_per_second)
+    clock = BenchmarkClock(sleep_scale)
+    kbm.set_client_factory(aws.client)
+    output = sys.stdout if verbose else io.StringIO()
+    try:
+        with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(output):
+            del _phase_events[:]
+            # Scenarios return when the measured part started, after generating files and any setup
+            started = SCENARIOS[name](aws, clock, workdir, file_size)
+            wall = time.monotonic() - started
+    finally:
+        kbm.set_client_factory(None)
+    return {
+        'scenario': name,
+        'wall_seconds': wall,
+        'sleep_seconds': clock.slept,
+        'work_seconds': max(wall - clock.slept, 0.0),
+        'production_sleep_seconds': clock.requested,
+        'api_calls': sum(aws.calls.values()),
+        'api_calls_by_operation': dict(sorted(aws.calls.items())),
+        'upload_mb_per_second': _upload_throughput(_phase_events, clock),
+    }
+
+def print_table(results):
+    print(f"{'Scenario':<14} {'Wall s':>8} {'Sleep s':>8} {'Work s':>8} {'Prod sleep s':>13} {'API calls':>10} {'Upload MB/s':>12}")
+    for r in results:
+        print(f"{r['scenario']:<14} {r['wall_seconds']:>8.2f} {r['sleep_seconds']:>8.2f} {r['work_seconds']:>8.2f} "
+              f"{r['production_sleep_seconds']:>13.1f} {r['api_calls']:>10} {r['upload_mb_per_second']:>12.1f}")
+
+def check_baseline(results, baseline_path, tolerance):
+    """Return the scenarios whose wall time regressed more than tolerance against the baseline"""
+    with open(baseline_path) as f:
+        baseline = {r['scenario']: r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        previous = baseline.get(r['scenario'])
+        if previous and r['wall_seconds'] > previous['wall_seconds'] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: {previous['wall_seconds']:.2f}s -> {r['wall_seconds']:.2f}s")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline provisioning and ingestion benchmark")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Run only these scenarios")
+    parser.add_argument('--latency', type=float, default=0.002, help="Seconds added to every fake API call")
+    parser.add_argument('--api-latency', action='append', default=[], metavar='API=SECONDS',
+                        help="Per-API latency, e.g. bedrock-agent.create_knowledge_base=0.2")
+    parser.add_argument('--polls', type=int, default=2, help="Status polls before each resource reports ready")
+    parser.add_argument('--sleep-scale', type=float, default=0.01, help="Fraction of each requested sleep actually slept")
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help="Bytes per generated document")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--save', help="Write results to this JSON file (e.g. a CI baseline)")
+    parser.add_argument('--baseline', help="Fail if wall time regressed against this JSON baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed regression against the baseline")
+    parser.add_argument('--verbose', action='store_true', help="Show the module's progress output")
+    args = parser.parse_args(argv)
+
+    api_latency = {}
+    for item in args.api_latency:
+        api, seconds = item.split('=', 1)
+        api_latency[api] = float(seconds)
+    results = [run_scenario(name, args.latency, api_latency, args.polls, args.sleep_scale, args.file_size,
+                            verbose=args.verbose)
+               for name in (args.scenario or list(SCENARIOS))]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ Regression: {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
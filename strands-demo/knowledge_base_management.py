@@ -1,97 +1,1653 @@
+import abc
 import boto3
+import asyncio
 import json
 import time
+import urllib.parse
 import os
+import random
+import re
+import contextlib
+import contextvars
+import functools
+import inspect
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait as wait_for_futures
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from lexical_index import BM25Index, document_chunks, drop_lexical_index, get_lexical_index, save_lexical_index
+from pdf_extraction import markdown_target, preprocess_files
+from harvest_tables import drop_tables, query_tables, store_tables, table_measures
 
-def create_knowledge_base_with_s3_vectors(topic_base: str, files: list[(str,str)], region="us-east-1"):
-    """Create Bedrock Knowledge Base with S3 Vectors - clean and simple"""
-    sts = boto3.client('sts', region_name=region)
-    account_id = sts.get_caller_identity()['Account']
+try:
+    from strands import tool
+except ImportError:  # strands is only needed when these functions are handed to an agent
+    def tool(fn):
+        return fn
+
+MB = 1024 * 1024
+
+# Time source for every wait in this module - tests and benchmarks swap in a fake clock
+class Clock:
+    """Real monotonic time; swap in a fake to test without real waiting"""
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        """Sleep until event is set or timeout passes; returns whether the event was set"""
+        return event.wait(timeout)
+
+SYSTEM_CLOCK = Clock()
+
+# Instrumentation - every provisioning and ingestion phase runs inside a timed span named
+# "knowledge_base.<phase>" with OpenTelemetry-style attributes. Finished spans become
+# PhaseEvents that are collected into the current ProvisioningReport and handed to event
+# listeners; the default tracer is a no-op, set_tracer(OpenTelemetryTracer()) exports them.
+SPAN_PREFIX = 'knowledge_base'
+
+PhaseEvent = namedtuple('PhaseEvent', ['phase', 'resource', 'parent', 'started', 'duration', 'polls', 'retries',
+                                       'bytes_uploaded', 'error'])
+
+class Span:
+    """Counters for the phase that is running right now"""
+    def __init__(self, phase, resource=None, parent=None, attributes=None):
+        self.phase = phase
+        self.resource = resource
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.polls = 0
+        self.retries = 0
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+
+    def add(self, polls=0, retries=0, bytes_uploaded=0):
+        with self._lock:
+            self.polls += polls
+            self.retries += retries
+            self.bytes_uploaded += bytes_uploaded
+
+    def otel_attributes(self):
+        attributes = {f"{SPAN_PREFIX}.{key}": value for key, value in self.attributes.items()}
+        attributes.update({
+            f"{SPAN_PREFIX}.phase": self.phase,
+            f"{SPAN_PREFIX}.resource": self.resource or '',
+            f"{SPAN_PREFIX}.polls": self.polls,
+            f"{SPAN_PREFIX}.retries": self.retries,
+            f"{SPAN_PREFIX}.bytes_uploaded": self.bytes_uploaded,
+        })
+        return attributes
+
+class NoopTracer:
+    @contextlib.contextmanager
+    def start_span(self, name, span):
+        yield
+
+class OpenTelemetryTracer:
+    """Exports spans through opentelemetry-api (configure the SDK/exporter separately)"""
+    def __init__(self, tracer_name=__name__):
+        from opentelemetry import trace
+        self._trace = trace
+        self._tracer = trace.get_tracer(tracer_name)
+
+    @contextlib.contextmanager
+    def start_span(self, name, span):
+        with self._tracer.start_as_current_span(name) as otel_span:
+            try:
+                yield
+            except Exception as e:
+                otel_span.record_exception(e)
+                otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(e)))
+                raise
+            finally:
+                otel_span.set_attributes(span.otel_attributes())
+
+class ProvisioningReport:
+    """Where the time went in one create/update call, and the ingestion jobs it started
+
+    With wait=False the entry points return before ingestion finishes; ingestion_jobs holds the
+    IngestionJob handles to wait on or watch. failed_documents lists the DocumentResults of
+    directly ingested documents that didn't make it.
+    """
+    def __init__(self, operation, topic=None, clock=None):
+        self.operation = operation
+        self.topic = topic
+        self.clock = clock or SYSTEM_CLOCK
+        self.started = self.clock.now()
+        self.finished = None
+        self.events = []
+        self.ingestion_jobs = []
+        self.failed_documents = []
+        self._lock = threading.Lock()
+
+    def add(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def add_ingestion_job(self, job):
+        with self._lock:
+            self.ingestion_jobs.append(job)
+
+    def add_failed_documents(self, results):
+        with self._lock:
+            self.failed_documents.extend(results)
+
+    def finish(self):
+        self.finished = self.clock.now()
+        return self
+
+    @property
+    def total_seconds(self):
+        return (self.finished if self.finished is not None else self.clock.now()) - self.started
+
+    def phases(self):
+        """{phase: seconds} for the top-level phases (nested phases are already included)"""
+        totals = {}
+        for event in self.events:
+            if event.parent is None:
+                totals[event.phase] = totals.get(event.phase, 0.0) + event.duration
+        return totals
+
+    def to_dict(self):
+        return {
+            'operation': self.operation,
+            'topic': self.topic,
+            'total_seconds': self.total_seconds,
+            'ingestion_jobs': [job.job_id for job in self.ingestion_jobs],
+            'failed_documents': [r.key for r in self.failed_documents],
+            'events': [dict(event._asdict(), error=str(event.error) if event.error else None)
+                       for event in self.events],
+        }
+
+    def summary(self):
+        lines = [f"⏱️  {self.operation} {self.topic or ''} took {self.total_seconds:.1f}s"]
+        for event in sorted(self.events, key=lambda e: e.started):
+            indent = '    ' if event.parent else '  '
+            details = [f"{event.duration:.2f}s"]
+            if event.polls:
+                details.append(f"{event.polls} polls")
+            if event.retries:
+                details.append(f"{event.retries} retries")
+            if event.bytes_uploaded:
+                details.append(f"{event.bytes_uploaded / MB:.1f} MB")
+            if event.error:
+                details.append(f"error: {event.error}")
+            lines.append(f"{indent}{event.phase:<16} {event.resource or '':<48} {', '.join(details)}")
+        return '\n'.join(lines)
+
+_tracer = NoopTracer()
+_event_listeners = []
+_current_span = contextvars.ContextVar('knowledge_base_span', default=None)
+_current_report = contextvars.ContextVar('knowledge_base_report', default=None)
+# Per context rather than a global, so concurrent create_knowledge_bases workers keep their own
+_last_report = contextvars.ContextVar('knowledge_base_last_report', default=None)
+
+def set_tracer(tracer):
+    """Route spans to tracer (e.g. OpenTelemetryTracer()); None restores the no-op default"""
+    global _tracer
+    _tracer = tracer or NoopTracer()
+
+def add_event_listener(fn):
+    """Call fn(PhaseEvent) for every finished phase"""
+    _event_listeners.append(fn)
+    return fn
+
+def current_span():
+    return _current_span.get()
+
+def record(polls=0, retries=0, bytes_uploaded=0):
+    """Add to the counters of the phase that is running, if any"""
+    active = _current_span.get()
+    if active is not None:
+        active.add(polls, retries, bytes_uploaded)
+
+@contextlib.contextmanager
+def span(phase, resource=None, **attributes):
+    parent = _current_span.get()
+    active = Span(phase, resource, parent.phase if parent else None, attributes)
+    token = _current_span.set(active)
+    # Phases are timed by the clock the entry point was given, like the report they go into
+    report = _current_report.get()
+    clock = report.clock if report is not None else SYSTEM_CLOCK
+    started = clock.now()
+    error = None
+    try:
+        with _tracer.start_span(f"{SPAN_PREFIX}.{phase}", active):
+            yield active
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        event = PhaseEvent(phase, resource, active.parent, started, clock.now() - started,
+                           active.polls, active.retries, active.bytes_uploaded, error)
+        if report is not None:
+            report.add(event)
+        for fn in list(_event_listeners):
+            try:
+                fn(event)
+            except Exception as e:
+                print(f"❌ Event listener failed: {e}")
+
+def traced(phase, resource=None):
+    """Run the decorated function in a span; resource names the argument that identifies the resource"""
+    def decorate(fn):
+        signature = inspect.signature(fn)
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            name = signature.bind_partial(*args, **kwargs).arguments.get(resource) if resource else None
+            with span(phase, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+@contextlib.contextmanager
+def reporting(operation, topic=None, report=None, clock=None):
+    """Collect the phases of one create/update call into a ProvisioningReport timed by clock"""
+    report = report or ProvisioningReport(operation, topic, clock)
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+        _last_report.set(report.finish())
+
+def last_report():
+    """The ProvisioningReport of the most recent create/update call made in this thread or task
+
+    Calls running concurrently (create_knowledge_bases, asyncio tasks) don't see each other's;
+    pass report= or read TopicResult.report for those.
+    """
+    return _last_report.get()
+
+def reported(operation):
+    """Give the decorated entry point a report= keyword and collect its phases into it"""
+    def decorate(fn):
+        signature = inspect.signature(fn)
+        @functools.wraps(fn)
+        def wrapper(topic_base, *args, report=None, **kwargs):
+            clock = signature.bind_partial(topic_base, *args, **kwargs).arguments.get('clock')
+            with reporting(operation, topic_base, report, clock):
+                return fn(topic_base, *args, **kwargs)
+        return wrapper
+    return decorate
+
+# Shared clients - one boto3 session per process and one client per (service, region, profile)
+# so the entry points stop rebuilding clients and re-asking STS who we are on every call. When the
+# credentials behind a profile rotate (STS/SSO), the client and account ID are replaced, not added to
+TopicNames = namedtuple('TopicNames', ['account_id', 'topic', 'bucket_name', 'kb_name', 'vector_bucket_name', 'role_name', 'vector_index_name'])
+
+# Enough pooled connections for the concurrent uploader (workers x multipart concurrency).
+# botocore's own retries are off: the RateLimiter hooks below retry with throttle-aware backoff
+CLIENT_CONFIG = Config(max_pool_connections=64, retries={'mode': 'standard', 'total_max_attempts': 1})
+
+_clients_lock = threading.RLock()
+_session = None
+_client_factory = None
+_clients = {}      # (service, region, profile) -> (access key, client)
+_account_ids = {}  # profile -> (access key, account ID)
+_account_lookups = {}  # (profile, access key) -> Future of the STS call in flight
+
+def _credentials():
+    """(session, profile, access key) in use; None for all three when a client factory is set
+
+    Looked up outside _clients_lock - refreshing SSO/STS credentials can call out to AWS.
+    """
+    global _session
+    if _client_factory is not None:
+        return None, None, None
+    with _clients_lock:
+        if _session is None:
+            _session = boto3.Session()
+        session = _session
+    credentials = session.get_credentials()
+    access_key = credentials.get_frozen_credentials().access_key if credentials is not None else None
+    return session, session.profile_name, access_key
+
+def get_client(service, region="us-east-1"):
+    """Return the shared, thread-safe boto3 client for this service/region/profile"""
+    session, profile, access_key = _credentials()
+    with _clients_lock:
+        key = (service, region, profile)
+        cached = _clients.get(key)
+        if cached is not None and cached[0] == access_key:
+            return cached[1]
+        if _client_factory is not None:
+            client = _client_factory(service, region)
+        else:
+            client = session.client(service, region_name=region, config=CLIENT_CONFIG)
+            _rate_limiter.install(client)
+        if cached is not None:
+            # Rotated credentials - the old client's KB index goes with it
+            _kb_indexes.pop(id(cached[1]), None)
+        _clients[key] = (access_key, client)
+        return client
+
+def get_account_id(region="us-east-1"):
+    """Resolve the caller's account ID once per profile and set of credentials"""
+    _, profile, access_key = _credentials()
+    with _clients_lock:
+        cached = _account_ids.get(profile)
+        if cached is not None and cached[0] == access_key:
+            return cached[1]
+        lookup = _account_lookups.get((profile, access_key))
+        owner = lookup is None
+        if owner:
+            lookup = _account_lookups[(profile, access_key)] = Future()
+    if not owner:
+        return lookup.result()
+    # Outside the lock so a slow STS call doesn't hold up every other get_client; concurrent
+    # callers wait on this lookup instead of asking STS themselves
+    try:
+        account_id = get_client('sts', region).get_caller_identity()['Account']
+        with _clients_lock:
+            _account_ids[profile] = (access_key, account_id)
+        lookup.set_result(account_id)
+        return account_id
+    except Exception as e:
+        lookup.set_exception(e)
+        raise
+    finally:
+        with _clients_lock:
+            _account_lookups.pop((profile, access_key), None)
+
+def topic_names(topic_base, region="us-east-1"):
+    """All resource names derived from a topic - the bucket name doubles as the topic"""
+    account_id = get_account_id(region)
     topic = topic_base + '-' + account_id
-    bucket_name = topic
-    kb_name = topic + '-kb'
-    vector_bucket_name = topic + '-vectors' 
-    role_name = f"{topic}-knowledge-base-access-role"
-    vector_index_name = f"{topic}-knowledge-base-index"
-    # Initialize clients
-    bedrock_agent = boto3.client('bedrock-agent', region_name=region)
-    s3 = boto3.client('s3', region_name=region)
-    s3vectors = boto3.client('s3vectors', region_name=region)
-    iam = boto3.client('iam', region_name=region)
+    return TopicNames(
+        account_id=account_id,
+        topic=topic,
+        bucket_name=topic,
+        kb_name=topic + '-kb',
+        vector_bucket_name=topic + '-vectors',
+        role_name=f"{topic}-knowledge-base-access-role",
+        vector_index_name=f"{topic}-knowledge-base-index",
+    )
+
+def set_client_factory(factory):
+    """Build clients with factory(service, region) instead of boto3 (stubs, fakes, benchmarks)"""
+    global _client_factory
+    with _clients_lock:
+        _client_factory = factory
+        reset_clients()
+
+def reset_clients():
+    """Drop cached clients and identities, e.g. after switching AWS credentials in a notebook"""
+    global _session
+    with _clients_lock:
+        _session = None
+        _clients.clear()
+        _account_ids.clear()
+        _kb_indexes.clear()
+
+# Rate limiting - every pooled client sends through one token bucket per region and service/API,
+# shared by all threads and tasks. A throttle response halves that bucket's rate and the call is retried after a
+# jittered backoff; successes grow the rate back, so concurrent provisioning settles at the limit
+API_RATE_LIMITS = {         # calls per second, per service or (service, API)
+    'bedrock-agent': 10.0,
+    ('bedrock-agent', 'ListKnowledgeBases'): 5.0,
+    ('bedrock-agent', 'GetKnowledgeBase'): 5.0,
+    ('bedrock-agent', 'GetIngestionJob'): 5.0,
+    's3vectors': 10.0,
+    'iam': 5.0,
+    'sts': 10.0,
+}
+GLOBAL_SERVICES = ('iam',)  # one quota for the account whichever region the client was made for
+MAX_RETRY_ATTEMPTS = 8
+MAX_RETRY_DELAY = 20.0
+THROTTLING_CODES = ('ThrottlingException', 'Throttling', 'ThrottledException', 'TooManyRequestsException',
+                  'RequestLimitExceeded', 'RequestThrottled', 'RequestThrottledException', 'SlowDown',
+                  'ProvisionedThroughputExceededException')
+TRANSIENT_CODES = ('InternalServerException', 'InternalFailure', 'ServiceUnavailable', 'ServiceUnavailableException',
+                   'RequestTimeout', 'RequestTimeoutException')
+
+class TokenBucket:
+    """rate calls per second with bursts of up to capacity; the rate adapts between min_rate and max_rate"""
+    def __init__(self, rate, capacity=None, min_rate=0.1, clock=None):
+        self.max_rate = self.rate = float(rate)
+        self.min_rate = min(min_rate, self.max_rate)
+        self.capacity = capacity or max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self.clock = clock or SYSTEM_CLOCK
+        self.updated = self.clock.now()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock.now()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take a token, sleeping until one is free; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            self.clock.sleep(delay)
+            waited += delay
+
+    def throttled(self):
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class RateLimiter:
+    """Token buckets per region and (service, API) from limits plus the botocore hooks that feed and retry through them"""
+    def __init__(self, limits=None, clock=None, max_attempts=MAX_RETRY_ATTEMPTS, max_delay=MAX_RETRY_DELAY):
+        self.limits = dict(API_RATE_LIMITS if limits is None else limits)
+        self.clock = clock or SYSTEM_CLOCK
+        self.max_attempts = max_attempts
+        self.max_delay = max_delay
+        self.buckets = {}   # (region, service or (service, API)) -> TokenBucket
+        self.stats = {}     # (service, API) -> {'calls', 'throttles', 'retries', 'waited'}
+        self.lock = threading.Lock()
+
+    def bucket(self, service, api, region=None):
+        """The shared bucket for an API in a region - its own if it has a limit, else its service's; None if unlimited"""
+        key = (service, api) if (service, api) in self.limits else service
+        if key not in self.limits:
+            return None
+        with self.lock:
+            # Service quotas apply per region, so every region gets its own buckets
+            region = None if service in GLOBAL_SERVICES else region
+            if (region, key) not in self.buckets:
+                self.buckets[(region, key)] = TokenBucket(self.limits[key], clock=self.clock)
+            return self.buckets[(region, key)]
+
+    def _count(self, service, api, **counts):
+        with self.lock:
+            stats = self.stats.setdefault((service, api), {'calls': 0, 'throttles': 0, 'retries': 0, 'waited': 0.0})
+            for name, value in counts.items():
+                stats[name] += value
+
+    def acquire(self, service, api, region=None):
+        bucket = self.bucket(service, api, region)
+        waited = bucket.acquire() if bucket else 0.0
+        self._count(service, api, calls=1, waited=waited)
+        return waited
+
+    def retry_delay(self, attempts, throttled):
+        # Full jitter; throttles back off from 1s, other transient errors from 0.1s
+        base = 1.0 if throttled else 0.1
+        return random.uniform(0, min(self.max_delay, base * 2 ** attempts))
+
+    def install(self, client):
+        """Route every request of a botocore client through the buckets and retry policy"""
+        service = client.meta.service_model.service_id.hyphenize()
+        region = client.meta.region_name
+
+        def before_send(event_name=None, **kwargs):
+            self.acquire(service, event_name.rsplit('.', 1)[-1], region)
+
+        def needs_retry(response=None, attempts=1, caught_exception=None, operation=None, **kwargs):
+            api = operation.name
+            code = response[1].get('Error', {}).get('Code') if response else None
+            status = response[0].status_code if response else None
+            throttled = code in THROTTLING_CODES or status == 429
+            transient = (throttled or code in TRANSIENT_CODES or status in (500, 502, 503, 504)
+                         or isinstance(caught_exception, (BotoConnectionError, HTTPClientError)))
+            bucket = self.bucket(service, api, region)
+            if bucket and throttled:
+                bucket.throttled()
+            elif bucket and not transient:
+                bucket.succeeded()
+            if not transient or attempts >= self.max_attempts:
+                return None
+            self._count(service, api, throttles=int(throttled), retries=1)
+            record(retries=1)
+            self.clock.sleep(self.retry_delay(attempts, throttled))
+            return 0
+
+        client.meta.events.register('before-send', before_send, unique_id='knowledge-base-rate-limit')
+        client.meta.events.register('needs-retry', needs_retry, unique_id='knowledge-base-retry')
+        return client
+
+    def summary(self):
+        lines = [f"{'API':<48} {'Calls':>6} {'Throttles':>9} {'Retries':>7} {'Waited s':>9}"]
+        for (service, api), stats in sorted(self.stats.items()):
+            lines.append(f"{service + '.' + api:<48} {stats['calls']:>6} {stats['throttles']:>9} "
+                         f"{stats['retries']:>7} {stats['waited']:>9.2f}")
+        return '\n'.join(lines)
+
+_rate_limiter = RateLimiter()
+
+def set_rate_limiter(limiter):
+    """Use limiter (e.g. RateLimiter(limits)) for clients created from now on; None restores the defaults"""
+    global _rate_limiter
+    with _clients_lock:
+        _rate_limiter = limiter or RateLimiter()
+        reset_clients()
+
+def get_rate_limiter():
+    return _rate_limiter
+
+# Knowledge base index - name -> ID maps built from fully paginated listings, cached with a TTL
+# and patched in place when we create or delete something ourselves
+INDEX_TTL_SECONDS = 300
+
+class KnowledgeBaseIndex:
+    """Cached name -> ID lookups for the knowledge bases and data sources behind one bedrock-agent client"""
+    def __init__(self, bedrock_agent, ttl=INDEX_TTL_SECONDS, clock=None):
+        self.bedrock_agent = bedrock_agent
+        self.ttl = ttl
+        self.clock = clock or SYSTEM_CLOCK
+        self._lock = threading.Lock()
+        self._kbs = None
+        self._kbs_loaded_at = 0.0
+        self._data_sources = {}  # kb_id -> (loaded_at, {ds_name: ds_id})
+
+    def _fresh(self, loaded_at):
+        return self.clock.now() - loaded_at < self.ttl
+
+    def knowledge_bases(self, refresh=False):
+        """Return {kb_name: kb_id} for every knowledge base in the account/region"""
+        with self._lock:
+            if refresh or self._kbs is None or not self._fresh(self._kbs_loaded_at):
+                kbs = {}
+                for page in self.bedrock_agent.get_paginator('list_knowledge_bases').paginate():
+                    for kb in page.get('knowledgeBaseSummaries', []):
+                        kbs[kb['name']] = kb['knowledgeBaseId']
+                self._kbs = kbs
+                self._kbs_loaded_at = self.clock.now()
+            return self._kbs
+
+    def knowledge_base_id(self, kb_name, refresh=False):
+        # A miss may be a knowledge base created since the listing was cached, so re-list before giving up
+        kb_id = self.knowledge_bases(refresh).get(kb_name)
+        if kb_id is None and not refresh:
+            kb_id = self.knowledge_bases(refresh=True).get(kb_name)
+        return kb_id
+
+    def data_sources(self, kb_id, refresh=False):
+        """Return {ds_name: ds_id} for one knowledge base"""
+        with self._lock:
+            cached = self._data_sources.get(kb_id)
+            if refresh or cached is None or not self._fresh(cached[0]):
+                sources = {}
+                paginator = self.bedrock_agent.get_paginator('list_data_sources')
+                for page in paginator.paginate(knowledgeBaseId=kb_id):
+                    for ds in page.get('dataSourceSummaries', []):
+                        sources[ds['name']] = ds['dataSourceId']
+                cached = (self.clock.now(), sources)
+                self._data_sources[kb_id] = cached
+            return cached[1]
+
+    def data_source_id(self, kb_id, ds_name, refresh=False):
+        return self.data_sources(kb_id, refresh).get(ds_name)
+
+    def add_knowledge_base(self, kb_name, kb_id):
+        with self._lock:
+            if self._kbs is not None:
+                self._kbs[kb_name] = kb_id
+
+    def remove_knowledge_base(self, kb_name):
+        with self._lock:
+            if self._kbs is not None:
+                kb_id = self._kbs.pop(kb_name, None)
+                self._data_sources.pop(kb_id, None)
+
+    def add_data_source(self, kb_id, ds_name, ds_id):
+        with self._lock:
+            if kb_id in self._data_sources:
+                self._data_sources[kb_id][1][ds_name] = ds_id
+
+    def remove_data_source(self, kb_id, ds_name):
+        with self._lock:
+            if kb_id in self._data_sources:
+                self._data_sources[kb_id][1].pop(ds_name, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._kbs = None
+            self._data_sources.clear()
+
+_kb_indexes = {}
+
+def get_kb_index(bedrock_agent):
+    """Return the shared KnowledgeBaseIndex for a bedrock-agent client"""
+    with _clients_lock:
+        index = _kb_indexes.get(id(bedrock_agent))
+        if index is None or index.bedrock_agent is not bedrock_agent:
+            index = KnowledgeBaseIndex(bedrock_agent)
+            _kb_indexes[id(bedrock_agent)] = index
+        return index
+
+# Backends - the public create/update/retrieve/query functions dispatch to a pluggable engine:
+# 'bedrock' is the Bedrock + S3 Vectors path in this module, 'local' is the in-process FAISS
+# engine in local_knowledge_base.py. Pick one with set_backend() or KNOWLEDGE_BASE_BACKEND.
+class KnowledgeBaseBackend(abc.ABC):
+    """Interface every knowledge base engine implements
+
+    create/update get metadata plus whichever sync options the caller changed from their
+    defaults; an engine raises TypeError for the ones it can't honour.
+    """
+    name = None
+
+    @abc.abstractmethod
+    def create(self, topic_base, files, region, **options):
+        pass
+
+    @abc.abstractmethod
+    def update(self, topic_base, files, kb_id, region, **options):
+        pass
+
+    @abc.abstractmethod
+    def find(self, topic_base, region):
+        pass
+
+    @abc.abstractmethod
+    def query(self, kb_id, query, top_k=5, region="us-east-1", filters=None):
+        pass
+
+class BedrockBackend(KnowledgeBaseBackend):
+    name = 'bedrock'
+
+    def create(self, topic_base, files, region, **options):
+        return create_knowledge_base_with_s3_vectors(topic_base, files, region, **options)
+
+    def update(self, topic_base, files, kb_id, region, **options):
+        return update_knowledge_base_with_s3_vectors(topic_base, files, kb_id, region, **options)
+
+    def find(self, topic_base, region):
+        return retrieve_knowledge_base(topic_base, region)
+
+    def query(self, kb_id, query, top_k=5, region="us-east-1", filters=None):
+        vector_search = {'numberOfResults': top_k}
+        if filters:
+            vector_search['filter'] = filters
+        response = get_client('bedrock-agent-runtime', region).retrieve(
+            knowledgeBaseId=kb_id,
+            retrievalQuery={'text': query},
+            retrievalConfiguration={'vectorSearchConfiguration': vector_search}
+        )
+        return response.get('retrievalResults', [])
+
+_backend = None
+
+def set_backend(backend):
+    """Use 'bedrock', 'local' or any KnowledgeBaseBackend instance for the public functions"""
+    global _backend
+    if backend == 'bedrock':
+        backend = BedrockBackend()
+    elif backend == 'local':
+        from local_knowledge_base import LocalBackend
+        backend = LocalBackend()
+    _backend = backend
+    return backend
+
+def _changed_options(function, **options):
+    """The options a caller set away from function's defaults - what a backend has to honour or reject"""
+    parameters = inspect.signature(function).parameters
+    return {name: value for name, value in options.items() if value != parameters[name].default}
+
+def get_backend():
+    if _backend is None:
+        set_backend(os.environ.get('KNOWLEDGE_BASE_BACKEND', 'bedrock'))
+    return _backend
+
+def _use_bedrock():
+    return isinstance(get_backend(), BedrockBackend)
+
+def query_knowledge_base(kb_id, query, top_k=5, region="us-east-1", filters=None):
+    """Top-k chunks for a query, as bedrock-agent-runtime retrieve() retrievalResults"""
+    return get_backend().query(kb_id, query, top_k, region, filters)
+
+# Retrieval cache - LRU + TTL cache in front of query_knowledge_base, capped by entry count and
+# approximate memory and dropped per KB whenever that KB's content changes (ingestion finished)
+_kb_change_listeners = []
+
+def add_knowledge_base_listener(fn):
+    """Call fn(kb_id) whenever a knowledge base's content changes"""
+    _kb_change_listeners.append(fn)
+    return fn
+
+def notify_knowledge_base_changed(kb_id):
+    for fn in list(_kb_change_listeners):
+        try:
+            fn(kb_id)
+        except Exception as e:
+            print(f"❌ Knowledge base listener failed for {kb_id}: {e}")
+
+def normalize_query(query):
+    return ' '.join(re.findall(r"[a-z0-9]+(?:['.-][a-z0-9]+)*", query.lower()))
+
+class RetrievalCache:
+    """Thread-safe LRU + TTL cache of retrieval results with hit-rate and latency counters"""
+    def __init__(self, max_entries=1024, max_bytes=32 * MB, ttl=900, clock=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock or SYSTEM_CLOCK
+        self._entries = OrderedDict()  # key -> (stored_at, size, results)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    @staticmethod
+    def key(kb_id, query, top_k, filters=None):
+        return (kb_id, normalize_query(query), top_k, json.dumps(filters, sort_keys=True) if filters else None)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.clock.now() - entry[0] >= self.ttl:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, results):
+        size = len(json.dumps(results, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self.clock.now(), size, results)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, kb_id=None):
+        """Forget cached results for one knowledge base, or everything"""
+        with self._lock:
+            for key in [key for key in self._entries if kb_id is None or key[0] == kb_id]:
+                self._drop(key)
+
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'avg_hit_ms': 1000 * self.hit_seconds / self.hits if self.hits else 0.0,
+                'avg_miss_ms': 1000 * self.miss_seconds / self.misses if self.misses else 0.0,
+            }
+
+retrieval_cache = RetrievalCache()
+add_knowledge_base_listener(retrieval_cache.invalidate)
+
+def cached_query_knowledge_base(kb_id, query, top_k=5, region="us-east-1", filters=None, cache=None):
+    """query_knowledge_base with results served from the retrieval cache when possible"""
+    cache = cache or retrieval_cache
+    started = cache.clock.now()
+    key = cache.key(kb_id, query, top_k, filters)
+    results = cache.get(key)
+    hit = results is not None
+    if not hit:
+        results = query_knowledge_base(kb_id, query, top_k, region, filters)
+        cache.put(key, results)
+    cache.record(hit, cache.clock.now() - started)
+    return results
+
+def format_results(results):
+    """Render retrieval results as text for an agent"""
+    if not results:
+        return "No results found."
+    lines = []
+    for result in results:
+        location = result.get('location', {})
+        source = (location.get('s3Location', {}).get('uri')
+                  or location.get('customDocumentLocation', {}).get('id')
+                  or result.get('metadata', {}).get('x-amz-bedrock-kb-source-uri', ''))
+        lines.append(f"Score: {result.get('score', 0):.4f}\nSource: {source}\nContent: {result['content']['text']}\n")
+    return '\n'.join(lines)
+
+@tool
+def cached_retrieve(kb_id: str, query: str, top_k: int = 5, region: str = "us-east-1") -> str:
+    """
+    Search a knowledge base, reusing recent results for the same question.
+
+    Args:
+        kb_id (str): The ID of the knowledge base to search.
+        query (str): The question or search text.
+        top_k (int): The number of chunks to return.
+        region (str): The AWS region of the knowledge base.
+
+    Returns:
+        str: The matching chunks with their scores and sources.
+    """
+    return format_results(cached_query_knowledge_base(kb_id, query, top_k, region))
+
+@tool
+def filtered_retrieve(kb_id: str, query: str, state: str = None, animal: str = None, year: int = None,
+                      top_k: int = 5, region: str = "us-east-1") -> str:
+    """
+    Search a knowledge base, only looking at documents for the given state, animal and/or year.
+
+    Args:
+        kb_id (str): The ID of the knowledge base to search.
+        query (str): The question or search text.
+        state (str): Only search reports for this state, e.g. "illinois".
+        animal (str): Only search reports for this animal, e.g. "turkey".
+        year (int): Only search reports for this year, e.g. 2023.
+        top_k (int): The number of chunks to return.
+        region (str): The AWS region of the knowledge base.
+
+    Returns:
+        str: The matching chunks with their scores and sources.
+    """
+    filters = metadata_filter(state=state, animal=animal, year=year)
+    return format_results(cached_query_knowledge_base(kb_id, query, top_k, region, filters))
+
+# Hybrid retrieval - BM25 over our own chunks of the uploaded documents, merged with the vector
+# scores, so exact tokens (unit numbers, hunt codes, years) rank where they should on the first call
+HYBRID_ALPHA = 0.5        # weight of the vector score; the rest goes to BM25
+HYBRID_CANDIDATES = 3     # fetch top_k * this many candidates from each side before merging
+
+@traced('lexical_index', 'kb_id')
+def index_documents_lexically(kb_id, files, bucket_name=None, metadata=None, removed=(), replace_all=False):
+    """Add (source, target) documents to a KB's BM25 index, replacing earlier versions of them"""
+    chunks = {}
+    for source, target in files:
+        uri = f"s3://{bucket_name}/{target}" if bucket_name else target
+        chunks[target] = document_chunks(source, target, (metadata or {}).get(target), uri)
+    index = None if replace_all else get_lexical_index(kb_id)
+    index = index.replace(chunks, removed) if index else BM25Index(c for cs in chunks.values() for c in cs)
+    save_lexical_index(kb_id, index)
+    print(f"🔤 Lexical index for {kb_id}: {len(index.chunks)} chunks, {len(index.postings)} terms")
+    return index
+
+def _lexical_result(chunk, score):
+    uri = chunk['uri']
+    location = ({'type': 'S3', 's3Location': {'uri': uri}} if uri.startswith('s3://')
+                else {'type': 'CUSTOM', 'customDocumentLocation': {'id': uri}})
+    return {
+        'content': {'text': chunk['text']},
+        'location': location,
+        'metadata': dict(chunk['metadata'], **{'x-amz-bedrock-kb-source-uri': uri}),
+        'score': score,
+    }
+
+def hybrid_query_knowledge_base(kb_id, query, top_k=5, region="us-east-1", filters=None, alpha=HYBRID_ALPHA):
+    """Vector and BM25 candidates merged by alpha * vector + (1 - alpha) * BM25 (both scaled to 0..1)"""
+    candidates = top_k * HYBRID_CANDIDATES
+    vector_results = cached_query_knowledge_base(kb_id, query, candidates, region, filters)
+    index = get_lexical_index(kb_id)
+    if index is None:
+        return vector_results[:top_k]
+    lexical = index.search(query, candidates, filters)
+    rescored = index.score(query, [r['content']['text'] for r in vector_results])
+    top_lexical = max(rescored + [score for score, _ in lexical] + [0.0]) or 1.0
+    vector_scores = [r.get('score', 0.0) for r in vector_results]
+    low, high = min(vector_scores, default=0.0), max(vector_scores, default=0.0)
+
+    merged = {}
+    for result, lexical_score in zip(vector_results, rescored):
+        vector_score = (result.get('score', 0.0) - low) / (high - low) if high > low else 1.0
+        merged[' '.join(result['content']['text'].split())] = dict(
+            result, score=alpha * vector_score + (1 - alpha) * lexical_score / top_lexical)
+    for lexical_score, chunk in lexical:
+        key = ' '.join(chunk['text'].split())
+        if key not in merged:
+            merged[key] = _lexical_result(chunk, (1 - alpha) * lexical_score / top_lexical)
+    return sorted(merged.values(), key=lambda r: r['score'], reverse=True)[:top_k]
+
+@tool
+def hybrid_retrieve(kb_id: str, query: str, top_k: int = 5, region: str = "us-east-1") -> str:
+    """
+    Search a knowledge base by meaning and by exact words at once - best for unit numbers, hunt codes and years.
+
+    Args:
+        kb_id (str): The ID of the knowledge base to search.
+        query (str): The question or search text.
+        top_k (int): The number of chunks to return.
+        region (str): The AWS region of the knowledge base.
+
+    Returns:
+        str: The matching chunks with their scores and sources.
+    """
+    return format_results(hybrid_query_knowledge_base(kb_id, query, top_k, region))
+
+# Harvest tables - the numeric cells of every table in the uploaded reports in a local SQLite
+# store (see harvest_tables), so success rates and harvest totals are an exact query, not a retrieval
+@traced('harvest_tables', 'kb_id')
+def table_sources(files):
+    """(source, target) pairs to read tables from, PDFs swapped for their (cached) extracted markdown"""
+    files = list(files)
+    targets = {target for _, target in files}
+    # With preprocess='alongside' the markdown is uploaded too, so its PDF would only add every table twice
+    pdfs = [(source, target) for source, target in files
+            if source.lower().endswith('.pdf') and markdown_target(target) not in targets]
+    sources = [(source, target) for source, target in files if not source.lower().endswith('.pdf')]
+    if pdfs:
+        extracted, _ = preprocess_files(pdfs, 'replace')
+        # PDFs without a text layer come back unchanged and have no tables to read
+        sources.extend((source, target) for (source, _), (_, target) in zip(extracted, pdfs)
+                       if not source.lower().endswith('.pdf'))
+    return sources
+
+def index_harvest_tables(kb_id, files, metadata=None, removed=(), replace_all=False, layout=None):
+    """Store the tables of (source, target) documents under their state/animal/year, replacing earlier versions"""
+    attributes = document_metadata(files, metadata or True, layout)
+    cells = store_tables(kb_id, ((source, target, attributes.get(target, {})) for source, target in table_sources(files)),
+                         removed, replace_all)
+    print(f"🔢 Stored {cells} table cells from {len(files)} documents for {kb_id}")
+    return cells
+
+def format_table_rows(rows):
+    """Render query_tables rows as text for an agent"""
+    if not rows:
+        return "No matching table cells found."
+    return '\n'.join(', '.join(f"{key}: {value:g}" if isinstance(value, float) else f"{key}: {value}"
+                               for key, value in row.items()) for row in rows)
+
+@tool
+def harvest_statistics(kb_id: str, state: str = None, animal: str = None, year: int = None, measure: str = None,
+                       label: str = None, aggregate: str = None, group_by: str = None) -> str:
+    """
+    Exact numbers from the tables in the harvest reports - use this for success rates, harvest
+    totals, hunter counts and other numeric questions instead of searching the text.
+    Call it without measure and label first to see which measures the reports have.
+
+    Args:
+        kb_id (str): The ID of the knowledge base the reports were loaded into.
+        state (str): Only use reports for this state, e.g. "utah".
+        animal (str): Only use reports for this animal, e.g. "deer".
+        year (int): Only use reports for this year, e.g. 2023.
+        measure (str): The table column to read, e.g. "harvest" or "success" (matches by substring).
+        label (str): The table row to read, e.g. "Unit 3" or "Archery" (matches by substring).
+        aggregate (str): Combine the matching values with "sum", "avg", "min", "max" or "count".
+        group_by (str): Comma separated columns to aggregate per: state, animal, year, label, measure, document.
+
+    Returns:
+        str: The matching cells (or aggregates), one per line, or the available measures.
+    """
+    if not measure and not label:
+        measures = table_measures(state, animal, year, kb_id)
+        if not measures:
+            return "No tables stored for these filters."
+        return "Available measures: " + ', '.join(f"{name} ({count} cells)" for name, count in measures.items())
+    group_by = [column.strip() for column in (group_by or '').split(',') if column.strip()]
+    try:
+        return format_table_rows(query_tables(state, animal, year, measure, label, aggregate, group_by, kb_id))
+    except ValueError as e:
+        return f"Invalid query: {e}"
+
+@reported('create')
+def create_knowledge_base_with_s3_vectors(topic_base: str, files: list[(str,str)], region="us-east-1", clock=None, upload_workers=8, wait=True,
+                                          reconcile=False, manifest_path=None, delete_missing=False, partitioned=False,
+                                          embedding_profile=None, metadata=None, lexical=False, preprocess=None,
+                                          tables=False, layout=None, hashes=None):
+    """Create Bedrock Knowledge Base with S3 Vectors - clean and simple
+
+    reconcile=True keeps whatever already matches (and its embeddings) instead of starting from scratch.
+    wait=False returns once ingestion has started; the IngestionJob handles are on the call's
+    ProvisioningReport (report= or last_report()) as ingestion_jobs.
+    partitioned=True gives every animal/state key prefix its own data source (see document_key), up to MAX_PARTITIONS.
+    embedding_profile picks the embedding model/dimension (default DEFAULT_EMBEDDING_PROFILE).
+    metadata=True writes state/animal/year sidecars derived from the keys (laid out as layout,
+    default DOCUMENT_KEY_LAYOUT); a {target: attributes} dict (e.g. pdf_downloader.metadata_for_upload) adds to them.
+    lexical=True also builds the BM25 index hybrid_query_knowledge_base merges with the vector scores.
+    preprocess='replace' (or True) uploads the extracted markdown of every PDF instead of the PDF,
+    preprocess='alongside' uploads both.
+    tables=True also stores the numeric table cells harvest_statistics queries.
+    hashes ({target: sha256}, see file_hashes) saves hashing the files again when the caller already has.
+    """
+    if preprocess:
+        files, metadata = prepare_documents(files, metadata, preprocess)
+    if not _use_bedrock():
+        options = _changed_options(create_knowledge_base_with_s3_vectors, reconcile=reconcile, manifest_path=manifest_path,
+                                   delete_missing=delete_missing, partitioned=partitioned, wait=wait)
+        kb_id = get_backend().create(topic_base, files, region, metadata=document_metadata(files, metadata, layout), **options)
+        if lexical:
+            index_documents_lexically(kb_id, files, None, document_metadata(files, metadata, layout), replace_all=True)
+        if tables:
+            index_harvest_tables(kb_id, files, metadata, replace_all=True, layout=layout)
+        notify_knowledge_base_changed(kb_id)
+        return kb_id
+    names = topic_names(topic_base, region)
+    if partitioned:
+        partitions = {partition_of(target) for _, target in files}
+        check_partitions(names.kb_name, partitions)
+    if reconcile:
+        kb_id = reconcile_knowledge_base(names, files, region, clock, upload_workers, manifest_path, delete_missing, wait,
+                                         embedding_profile, metadata, lexical, tables, layout, hashes, partitioned)
+        _print_summary("Knowledge Base reconciled with S3 Vectors", kb_id, names)
+        return kb_id
+    account_id = names.account_id
+    bucket_name = names.bucket_name
+    kb_name = names.kb_name
+    vector_bucket_name = names.vector_bucket_name
+    role_name = names.role_name
+    vector_index_name = names.vector_index_name
+    # Shared clients
+    bedrock_agent = get_client('bedrock-agent', region)
+    s3 = get_client('s3', region)
+    s3vectors = get_client('s3vectors', region)
+    iam = get_client('iam', region)
     #kb name = bucket name
-    clean_up_knowledgebase(bedrock_agent, kb_name)
+    clean_up_knowledgebase(bedrock_agent, kb_name, clock)
     create_s3_bucket(s3, bucket_name, region)
-    for file in files:
-        source, target = file
-        upload_file(s3, bucket_name, source, target)
-    vector_index_arn = create_s3_vector_bucket(s3vectors, region, account_id, vector_bucket_name, vector_index_name)
-    role_arn = create_bedrock_iam(iam, role_name, bucket_name, region)
-    kb_id = create_bedrock_knowledge_base(bedrock_agent, kb_name, region, role_arn, vector_index_arn)
-    add_data_source_to_knowledge_base(bedrock_agent, kb_name, bucket_name, kb_id)
+    upload_tracked_files(s3, bucket_name, files, manifest_path, upload_workers, clock, hashes)
+    upload_metadata(s3, bucket_name, document_metadata(files, metadata, layout), upload_workers)
+    vector_index_arn = create_s3_vector_bucket(s3vectors, region, account_id, vector_bucket_name, vector_index_name, clock,
+                                               embedding_profile)
+    role_arn = create_bedrock_iam(iam, role_name, bucket_name, region, clock, embedding_profile)
+    kb_id = create_bedrock_knowledge_base(bedrock_agent, kb_name, region, role_arn, vector_index_arn, clock, embedding_profile)
+    if lexical:
+        index_documents_lexically(kb_id, files, bucket_name, document_metadata(files, metadata, layout), replace_all=True)
+    if tables:
+        index_harvest_tables(kb_id, files, metadata, replace_all=True, layout=layout)
+    if partitioned:
+        ingest_partitions(bedrock_agent, kb_name, bucket_name, kb_id, partitions, clock, wait)
+    else:
+        add_data_source_to_knowledge_base(bedrock_agent, kb_name, bucket_name, kb_id, clock, wait)
     print(f"🚀 Creating Knowledge Base: {kb_name}")
     print(f"📊 Using S3 Vectors for vector storage")
     
-    print(f"\n🎉 Success! Knowledge Base created with S3 Vectors")
-    print(f"📋 Knowledge Base ID: {kb_id}")
-    print(f"🎯 Vector Bucket: {vector_bucket_name}")
-    print(f"📍 Vector Index: {vector_index_name}")
-    print(f"🔑 IAM Role: {role_name}")
+    _print_summary("Knowledge Base created with S3 Vectors", kb_id, names)
     return kb_id
     
-def update_knowledge_base_with_s3_vectors(topic_base: str, files: list[(str,str)], kb_id, region="us-east-1"):
-    """Create Bedrock Knowledge Base with S3 Vectors - clean and simple"""
-    sts = boto3.client('sts', region_name=region)
-    account_id = sts.get_caller_identity()['Account']
-    topic = topic_base + '-' + account_id
-    bucket_name = topic
-    kb_name = topic + '-kb'
-    vector_bucket_name = topic + '-vectors' 
-    role_name = f"{topic}-knowledge-base-access-role"
-    vector_index_name = f"{topic}-knowledge-base-index"
-    # Initialize clients
-    bedrock_agent = boto3.client('bedrock-agent', region_name=region)
-    s3 = boto3.client('s3', region_name=region)
+@reported('update')
+def update_knowledge_base_with_s3_vectors(topic_base: str, files: list[(str,str)], kb_id, region="us-east-1", clock=None, upload_workers=8,
+                                          incremental=False, manifest_path=None, delete_missing=False, wait=True,
+                                          direct=False, direct_threshold=None, partitioned=False, metadata=None,
+                                          lexical=False, preprocess=None, tables=False, layout=None):
+    """Create Bedrock Knowledge Base with S3 Vectors - clean and simple
+
+    direct=True (implies incremental) ingests just the changed documents unless more than
+    direct_threshold (default DIRECT_INGESTION_THRESHOLD) changed, in which case the data
+    source is synced as usual. partitioned=True (implies incremental) only ingests the
+    partitions whose documents changed. metadata, layout, lexical, preprocess and tables work as for create.
+    """
+    if preprocess:
+        files, metadata = prepare_documents(files, metadata, preprocess)
+    if not _use_bedrock():
+        options = _changed_options(update_knowledge_base_with_s3_vectors, incremental=incremental, manifest_path=manifest_path,
+                                   delete_missing=delete_missing, wait=wait, direct=direct,
+                                   direct_threshold=direct_threshold, partitioned=partitioned)
+        get_backend().update(topic_base, files, kb_id, region, metadata=document_metadata(files, metadata, layout), **options)
+        # With delete_missing files is the whole corpus, so rebuilding drops the removed documents too
+        if lexical:
+            index_documents_lexically(kb_id, files, None, document_metadata(files, metadata, layout),
+                                      replace_all=delete_missing)
+        if tables:
+            index_harvest_tables(kb_id, files, metadata, replace_all=delete_missing, layout=layout)
+        notify_knowledge_base_changed(kb_id)
+        return kb_id
+    names = topic_names(topic_base, region)
+    bucket_name = names.bucket_name
+    kb_name = names.kb_name
+    # Shared clients
+    bedrock_agent = get_client('bedrock-agent', region)
+    s3 = get_client('s3', region)
     #kb name = bucket name
-    for file in files:
-        source, target = file
-        upload_file(s3, bucket_name, source, target)
-    update_data_source(bedrock_agent, kb_name, bucket_name, kb_id)
+    if partitioned and find_data_source_id(bedrock_agent, kb_id, f"{kb_name}-datasource"):
+        # A bucket-wide data source would ingest every partition a second time
+        print(f"⚠️  {kb_name} has a bucket-wide data source, updating it instead of partitions")
+        partitioned = False
+        incremental = True
+    elif (not partitioned and not find_data_source_id(bedrock_agent, kb_id, f"{kb_name}-datasource")
+          and partition_data_sources(bedrock_agent, kb_name, kb_id)):
+        # Adding a bucket-wide data source would ingest every partition a second time
+        print(f"⚠️  {kb_name} was created with partitioned=True, updating its partitions")
+        partitioned = True
+    if partitioned:
+        # Fail before uploading anything if a key doesn't fit the partitioned layout or the quota
+        check_partitions(kb_name, {partition_of(target) for _, target in files},
+                         partition_data_sources(bedrock_agent, kb_name, kb_id))
+    if incremental or direct or partitioned:
+        # Only push what changed and skip ingestion entirely when nothing did
+        plan = sync_files(s3, bucket_name, files, manifest_path, delete_missing, upload_workers, clock)
+        if plan.is_empty():
+            print(f"✅ Knowledge Base already up to date: {kb_id}")
+            return kb_id
+        changed = [target for _, target in plan.upload] + plan.delete
+        threshold = DIRECT_INGESTION_THRESHOLD if direct_threshold is None else direct_threshold
+        sidecars = document_metadata(plan.upload, metadata, layout)
+        upload_metadata(s3, bucket_name, sidecars, upload_workers)
+        if lexical:
+            index_documents_lexically(kb_id, plan.upload, bucket_name, sidecars, removed=plan.delete)
+        if tables:
+            index_harvest_tables(kb_id, plan.upload, metadata, removed=plan.delete, layout=layout)
+        if partitioned:
+            if direct and len(changed) <= threshold:
+                check_documents(ingest_partition_documents(bedrock_agent, kb_name, bucket_name, kb_id,
+                                                           [target for _, target in plan.upload], plan.delete, clock,
+                                                           sidecars))
+            else:
+                ingest_partitions(bedrock_agent, kb_name, bucket_name, kb_id, {partition_of(key) for key in changed},
+                                  clock, wait)
+            _print_summary("Knowledge Base updated knowledge base with S3 Vectors", kb_id, names)
+            return kb_id
+        ds_id = direct and find_data_source_id(bedrock_agent, kb_id, f"{kb_name}-datasource")
+        if ds_id and len(changed) <= threshold:
+            check_documents(ingest_documents(bedrock_agent, kb_id, ds_id, bucket_name,
+                                             [target for _, target in plan.upload], plan.delete, clock,
+                                             metadata_keys=sidecars))
+            _print_summary("Knowledge Base updated knowledge base with S3 Vectors", kb_id, names)
+            return kb_id
+    else:
+        upload_tracked_files(s3, bucket_name, files, manifest_path, upload_workers, clock)
+        upload_metadata(s3, bucket_name, document_metadata(files, metadata, layout), upload_workers)
+        if lexical:
+            index_documents_lexically(kb_id, files, bucket_name, document_metadata(files, metadata, layout))
+        if tables:
+            index_harvest_tables(kb_id, files, metadata, layout=layout)
+    update_data_source(bedrock_agent, kb_name, bucket_name, kb_id, clock, wait)
     
-    print(f"\n🎉 Success! Knowledge Base updated knowledge base with S3 Vectors")
-    print(f"📋 Knowledge Base ID: {kb_id}")
-    print(f"🎯 Vector Bucket: {vector_bucket_name}")
-    print(f"📍 Vector Index: {vector_index_name}")
-    print(f"🔑 IAM Role: {role_name}")
+    _print_summary("Knowledge Base updated knowledge base with S3 Vectors", kb_id, names)
     return kb_id
 
 def retrieve_knowledge_base(topic_base:str, region= "us-east-1"):
-    sts = boto3.client('sts', region_name=region)
-    account_id = sts.get_caller_identity()['Account']
-    topic = topic_base + '-' + account_id
-    kb_name = topic + '-kb'
-    bedrock_agent = boto3.client('bedrock-agent', region_name=region)
+    if not _use_bedrock():
+        return get_backend().find(topic_base, region)
+    kb_name = topic_names(topic_base, region).kb_name
+    bedrock_agent = get_client('bedrock-agent', region)
+    return get_kb_index(bedrock_agent).knowledge_base_id(kb_name)
+
+# Fan-out retrieval - one question asked of several topic KBs at once, so a multi-state question
+# costs the slowest KB's latency instead of the sum; every KB embeds with the same model, so their
+# scores can be merged directly
+FAN_OUT_WORKERS = 8
+
+def fan_out_query(topic_bases, query, top_k=5, region="us-east-1", filters=None, max_workers=FAN_OUT_WORKERS):
+    """Query every topic's KB concurrently; returns (top_k results by score, {topic: error} for topics that failed)"""
+    topic_bases = list(dict.fromkeys(topic_bases))
+    if not topic_bases:
+        return [], {}
+
+    def search(topic_base):
+        kb_id = retrieve_knowledge_base(topic_base, region)
+        if kb_id is None:
+            raise LookupError(f"No knowledge base for topic {topic_base}")
+        return [dict(result, metadata=dict(result.get('metadata', {}), topic=topic_base))
+                for result in cached_query_knowledge_base(kb_id, query, top_k, region, filters)]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(topic_bases)))) as pool:
+        futures = {topic_base: pool.submit(contextvars.copy_context().run, search, topic_base)
+                   for topic_base in topic_bases}
+    merged, errors = {}, {}
+    for topic_base, future in futures.items():
+        if future.exception() is not None:
+            errors[topic_base] = future.exception()
+            continue
+        for result in future.result():
+            # The same passage can sit in several topics' KBs; keep its best-scoring copy
+            key = ' '.join(result['content']['text'].split())
+            if key not in merged or result.get('score', 0) > merged[key].get('score', 0):
+                merged[key] = result
+    return sorted(merged.values(), key=lambda r: r.get('score', 0), reverse=True)[:top_k], errors
+
+@tool
+def multi_topic_retrieve(topics: list[str], query: str, top_k: int = 5, region: str = "us-east-1") -> str:
+    """
+    Search the knowledge bases of several topics at once, e.g. to compare states or animals.
+
+    Args:
+        topics (list[str]): The topics whose knowledge bases to search, e.g. ["hunting-utah", "hunting-illinois"].
+        query (str): The question or search text.
+        top_k (int): The number of chunks to return across all topics.
+        region (str): The AWS region of the knowledge bases.
+
+    Returns:
+        str: The best matching chunks from all topics with their scores and sources.
+    """
+    results, errors = fan_out_query(topics, query, top_k, region)
+    text = format_results(results)
+    if errors:
+        text += '\n' + '\n'.join(f"Could not search {topic}: {error}" for topic, error in errors.items())
+    return text
+
+# Async provisioning - the create stages modelled as a dependency graph so independent
+# stages (IAM role, vector bucket/index, document bucket/uploads) run at the same time
+def provisioning_stages(names, files, region="us-east-1", clock=None, upload_workers=8, embedding_profile=None,
+                        metadata=None, layout=None, wait=True, manifest_path=None, partitioned=False, lexical=False,
+                        tables=False, hashes=None):
+    """Return {stage: (dependencies, fn(results))} for creating a topic's knowledge base
+
+    The options mean what they do for create_knowledge_base_with_s3_vectors.
+    """
+    bedrock_agent = get_client('bedrock-agent', region)
+    s3 = get_client('s3', region)
+    s3vectors = get_client('s3vectors', region)
+    iam = get_client('iam', region)
+
+    def upload(results):
+        uploaded = upload_tracked_files(s3, names.bucket_name, files, manifest_path, upload_workers, clock, hashes)
+        upload_metadata(s3, names.bucket_name, document_metadata(files, metadata, layout), upload_workers)
+        return uploaded
+
+    def ingest(results):
+        if partitioned:
+            return ingest_partitions(bedrock_agent, names.kb_name, names.bucket_name, results['knowledge_base'],
+                                     {partition_of(target) for _, target in files}, clock, wait)
+        return add_data_source_to_knowledge_base(bedrock_agent, names.kb_name, names.bucket_name,
+                                                 results['knowledge_base'], clock, wait)
+
+    stages = {
+        'cleanup': ((), lambda r: clean_up_knowledgebase(bedrock_agent, names.kb_name, clock)),
+        'bucket': ((), lambda r: create_s3_bucket(s3, names.bucket_name, region)),
+        'upload': (('bucket',), upload),
+        # The old KB still points at the index, so only replace it once the KB is gone
+        'vector_index': (('cleanup',), lambda r: create_s3_vector_bucket(
+            s3vectors, region, names.account_id, names.vector_bucket_name, names.vector_index_name, clock,
+            embedding_profile)),
+        'role': ((), lambda r: create_bedrock_iam(iam, names.role_name, names.bucket_name, region, clock,
+                                                  embedding_profile)),
+        'knowledge_base': (('cleanup', 'vector_index', 'role'), lambda r: create_bedrock_knowledge_base(
+            bedrock_agent, names.kb_name, region, r['role'], r['vector_index'], clock, embedding_profile)),
+        'data_source': (('knowledge_base', 'upload'), ingest),
+    }
+    # The local indexes only need the KB id, so they build while the documents ingest
+    if lexical:
+        stages['lexical'] = (('knowledge_base',), lambda r: index_documents_lexically(
+            r['knowledge_base'], files, names.bucket_name, document_metadata(files, metadata, layout), replace_all=True))
+    if tables:
+        stages['tables'] = (('knowledge_base',), lambda r: index_harvest_tables(
+            r['knowledge_base'], files, metadata, replace_all=True, layout=layout))
+    return stages
+
+def _check_stage_graph(stages):
+    visiting, done = set(), set()
+    def visit(name, path):
+        if name not in stages:
+            raise ValueError(f"Unknown stage {name!r} required by {path[-1]!r}")
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for dep in stages[name][0]:
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+    for name in stages:
+        visit(name, [])
+
+async def run_stage_graph(stages, executor=None):
+    """Run every stage as soon as its dependencies finish and return {stage: result}
+
+    Stage functions get the results of their dependencies; plain functions run in a worker
+    thread (of executor, if given) and coroutine functions run on the event loop. The first
+    failure cancels the rest.
+    """
+    _check_stage_graph(stages)
+    tasks = {}
+
+    async def run(name):
+        deps, fn = stages[name]
+        await asyncio.gather(*(tasks[dep] for dep in deps))
+        results = {dep: tasks[dep].result() for dep in deps}
+        if asyncio.iscoroutinefunction(fn):
+            return await fn(results)
+        # Carry the current span/report into the worker thread
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, context.run, fn, results)
+
+    for name in stages:
+        tasks[name] = asyncio.ensure_future(run(name))
     try:
-        kbs = bedrock_agent.list_knowledge_bases()
-        for kb in kbs.get('knowledgeBaseSummaries', []):
-            if kb['name'] == kb_name:
-                return kb['knowledgeBaseId']
-    except:
-        pass
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {name: task.result() for name, task in tasks.items()}
+
+async def acreate_knowledge_base_with_s3_vectors(topic_base: str, files: list[(str,str)], region="us-east-1", clock=None, upload_workers=8,
+                                                 executor=None, report=None, embedding_profile=None, metadata=None,
+                                                 preprocess=None, layout=None, wait=True, reconcile=False,
+                                                 manifest_path=None, delete_missing=False, partitioned=False,
+                                                 lexical=False, tables=False, hashes=None):
+    """Async create - await it from a notebook cell; latency is the critical path, not the sum of stages
+
+    Takes the same options as create_knowledge_base_with_s3_vectors.
+    """
+    if not _use_bedrock() or reconcile:
+        # Other backends and reconciliation have no provisioning stages to overlap, so run the sync create in a worker
+        create = functools.partial(create_knowledge_base_with_s3_vectors, topic_base, files, region, clock,
+                                   upload_workers, wait, reconcile, manifest_path, delete_missing, partitioned,
+                                   embedding_profile, metadata, lexical, preprocess, tables, layout, hashes,
+                                   report=report)
+        return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, create)
+    with reporting('create', topic_base, report, clock):
+        if preprocess:
+            context = contextvars.copy_context()
+            files, metadata = await asyncio.get_running_loop().run_in_executor(
+                executor, context.run, prepare_documents, files, metadata, preprocess)
+        names = await asyncio.get_running_loop().run_in_executor(executor, topic_names, topic_base, region)
+        if partitioned:
+            check_partitions(names.kb_name, {partition_of(target) for _, target in files})
+        print(f"🚀 Creating Knowledge Base: {names.kb_name}")
+        results = await run_stage_graph(
+            provisioning_stages(names, files, region, clock, upload_workers, embedding_profile, metadata, layout,
+                                wait, manifest_path, partitioned, lexical, tables, hashes),
+            executor)
+        kb_id = results['knowledge_base']
+        _print_summary("Knowledge Base created with S3 Vectors", kb_id, names)
+        return kb_id
+
+def _print_summary(title, kb_id, names):
+    print(f"\n🎉 Success! {title}")
+    print(f"📋 Knowledge Base ID: {kb_id}")
+    print(f"🎯 Vector Bucket: {names.vector_bucket_name}")
+    print(f"📍 Vector Index: {names.vector_index_name}")
+    print(f"🔑 IAM Role: {names.role_name}")
+    report = _current_report.get()
+    if report is not None:
+        print(report.summary())
+
+# Bulk provisioning - one KB per state/animal topic, created concurrently under a cap and
+# sharing the client pool, account lookup and ingestion monitor
+TopicResult = namedtuple('TopicResult', ['topic_base', 'kb_id', 'seconds', 'error', 'report'])
+
+async def acreate_knowledge_bases(specs, region="us-east-1", max_concurrency=4, clock=None, upload_workers=8,
+                                  **options):
+    """Create a knowledge base for every (topic_base, files) spec and return one TopicResult each
+
+    Goes through acreate_knowledge_base_with_s3_vectors, so KNOWLEDGE_BASE_BACKEND=local builds local ones.
+    Other options (embedding_profile, metadata, lexical, reconcile, ...) go to every topic's create.
+    """
+    clock = clock or SYSTEM_CLOCK
+    specs = list(specs)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Every topic can have several stages blocked in waiters at once, so size the pool for that
+    with ThreadPoolExecutor(max_workers=max(4, max_concurrency * 4), thread_name_prefix='provision') as executor:
+        async def create(topic_base, files):
+            async with semaphore:
+                started = clock.now()
+                report = ProvisioningReport('create', topic_base, clock)
+                try:
+                    kb_id = await acreate_knowledge_base_with_s3_vectors(
+                        topic_base, files, region, clock, upload_workers, executor, report=report, **options)
+                    return TopicResult(topic_base, kb_id, clock.now() - started, None, report)
+                except Exception as e:
+                    print(f"❌ Failed to create Knowledge Base for {topic_base}: {e}")
+                    return TopicResult(topic_base, None, clock.now() - started, e, report)
+        results = await asyncio.gather(*(create(topic_base, files) for topic_base, files in specs))
+    print_topic_results(results)
+    return results
+
+def create_knowledge_bases(specs, region="us-east-1", max_concurrency=4, clock=None, upload_workers=8, **options):
+    """Blocking wrapper around acreate_knowledge_bases that also works inside a running (Jupyter) loop"""
+    def run():
+        return asyncio.run(acreate_knowledge_bases(specs, region, max_concurrency, clock, upload_workers, **options))
+    with ThreadPoolExecutor(max_workers=1) as runner:
+        return runner.submit(run).result()
+
+def print_topic_results(results):
+    width = max([len('Topic')] + [len(r.topic_base) for r in results])
+    print(f"\n{'Topic':<{width}}  {'Knowledge Base ID':<18}  {'Seconds':>8}  Error")
+    for r in results:
+        print(f"{r.topic_base:<{width}}  {r.kb_id or '-':<18}  {r.seconds:>8.1f}  {r.error or ''}")
+
+# Multi-region replicas - the same topic KB provisioned into several regions (the first one keeps the
+# plain topic name, the others get the region appended since bucket and role names are global), and
+# a router that sends each query to the fastest healthy replica, hedging when one runs past its p95
+REPLICA_REGIONS = ("us-east-1", "us-west-2")
+RegionResult = namedtuple('RegionResult', ['region', 'kb_id', 'seconds', 'error'])
+
+def replica_topic(topic_base, region, primary_region):
+    return topic_base if region == primary_region else f"{topic_base}-{region}"
+
+def replica_manifest_path(manifest_path, region):
+    """Per-region manifest next to manifest_path (manifest.json -> manifest.us-west-2.json)"""
+    if not manifest_path:
+        return None
+    root, extension = os.path.splitext(manifest_path)
+    return f"{root}.{region}{extension}"
+
+def create_knowledge_base_replicas(topic_base, files, regions=REPLICA_REGIONS, clock=None, upload_workers=8,
+                                   manifest_path=None, reconcile=True, **options):
+    """Provision topic_base in every region at once and return one RegionResult per region
+
+    reconcile=True (the default) makes re-running it cheap: each region only uploads and ingests
+    what changed. The documents are hashed once for all regions; manifest_path gets a per-region
+    file (see replica_manifest_path). Other options go to create_knowledge_base_with_s3_vectors.
+    """
+    if not _use_bedrock():
+        raise ValueError(f"Replicas are Bedrock knowledge bases in several AWS regions, the {get_backend().name} "
+                         f"backend keeps a single copy - use create_knowledge_base_with_s3_vectors")
+    clock = clock or SYSTEM_CLOCK
+    regions = list(regions)
+    files = list(files)
+    if options.get('preprocess'):
+        files, options['metadata'] = prepare_documents(files, options.get('metadata'), options.pop('preprocess'))
+    hashes = file_hashes(files, upload_workers)
+
+    def create(region):
+        started = clock.now()
+        try:
+            kb_id = create_knowledge_base_with_s3_vectors(
+                replica_topic(topic_base, region, regions[0]), files, region, clock, upload_workers,
+                reconcile=reconcile, manifest_path=replica_manifest_path(manifest_path, region), hashes=hashes,
+                **options)
+            return RegionResult(region, kb_id, clock.now() - started, None)
+        except Exception as e:
+            print(f"❌ Failed to create Knowledge Base for {topic_base} in {region}: {e}")
+            return RegionResult(region, None, clock.now() - started, e)
+
+    with ThreadPoolExecutor(max_workers=len(regions) or 1, thread_name_prefix='replica') as pool:
+        results = list(pool.map(lambda region: contextvars.copy_context().run(create, region), regions))
+    width = max(len('Region'), *(len(r.region) for r in results))
+    print(f"\n{'Region':<{width}}  {'Knowledge Base ID':<18}  {'Seconds':>8}  Error")
+    for r in results:
+        print(f"{r.region:<{width}}  {r.kb_id or '-':<18}  {r.seconds:>8.1f}  {r.error or ''}")
+    replicas = {r.region: r.kb_id for r in results if r.kb_id}
+    if replicas:
+        with _clients_lock:
+            previous = _routers.get(topic_base)
+            _routers[topic_base] = RegionRouter(replicas)
+        if previous is not None:
+            previous.close()
+        # The router now answers from the rebuilt replicas; nothing cached for the old or new ones still holds
+        for kb_id in set(replicas.values()) | set(previous.replicas.values() if previous is not None else ()):
+            notify_knowledge_base_changed(kb_id)
+    return results
+
+def find_knowledge_base_replicas(topic_base, regions=REPLICA_REGIONS):
+    """{region: kb_id} of the replicas of topic_base that exist"""
+    regions = list(regions)
+    replicas = {region: retrieve_knowledge_base(replica_topic(topic_base, region, regions[0]), region)
+                for region in regions}
+    return {region: kb_id for region, kb_id in replicas.items() if kb_id}
+
+class RegionRouter:
+    """Routes queries across {region: kb_id} replicas by recent latency and error rate
+
+    Each query goes to the healthy replica with the lowest median latency. If it hasn't answered
+    by that replica's p95 (hedge_percentile), the next replica gets the same query and the first
+    answer wins. A replica whose error rate over its last error_window calls reaches
+    error_threshold is skipped for cooldown seconds, unless every replica is. Replicas without
+    min_samples latencies - new ones, and ones back from a cooldown - rank behind the measured
+    healthy ones, so they only get traffic as a hedge until they have proven themselves.
+    """
+    def __init__(self, replicas, clock=None, window=100, min_samples=5, hedge_percentile=95, default_hedge=1.0,
+                 error_window=20, error_threshold=0.5, cooldown=30.0, max_workers=8):
+        self.replicas = dict(replicas)
+        self.clock = clock or SYSTEM_CLOCK
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge = default_hedge
+        self.error_window = error_window
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.latencies = {region: [] for region in self.replicas}   # seconds of recent successes
+        self.outcomes = {region: [] for region in self.replicas}    # True/False of recent calls
+        self.unhealthy_until = {region: 0.0 for region in self.replicas}
+        self.hedges = 0
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='region-router')
+
+    def close(self):
+        """Stop the hedging threads - queries not started yet are cancelled, running ones finish first"""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def _percentile(self, region, pct):
+        latencies = sorted(self.latencies[region])
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def _record(self, region, seconds, ok):
+        with self.lock:
+            outcomes = self.outcomes[region]
+            outcomes.append(ok)
+            del outcomes[:-self.error_window]
+            if ok:
+                self.latencies[region].append(seconds)
+                del self.latencies[region][:-self.window]
+            elif len(outcomes) >= self.min_samples and outcomes.count(False) / len(outcomes) >= self.error_threshold:
+                self.unhealthy_until[region] = self.clock.now() + self.cooldown
+                outcomes.clear()
+                # Its old latencies say nothing about how it does after the cooldown
+                self.latencies[region].clear()
+                print(f"⚠️  Routing around {region} for {self.cooldown:.0f}s after repeated errors")
+
+    def ranked(self):
+        """Regions in the order they will be tried - measured healthy ones by median, then unmeasured, then cooling down"""
+        now = self.clock.now()
+        with self.lock:
+            def key(region):
+                median = self._percentile(region, 50)
+                # Unmeasured replicas only take primary queries when no measured one is healthy
+                return (self.unhealthy_until[region] > now, median is None, median or 0.0)
+            return sorted(self.replicas, key=key)
+
+    def hedge_delay(self, region):
+        with self.lock:
+            p = self._percentile(region, self.hedge_percentile)
+        return p if p is not None else self.default_hedge
+
+    def _query(self, region, query, top_k, filters):
+        started = self.clock.now()
+        try:
+            results = query_knowledge_base(self.replicas[region], query, top_k, region, filters)
+        except Exception:
+            self._record(region, self.clock.now() - started, False)
+            raise
+        self._record(region, self.clock.now() - started, True)
+        return results
+
+    def query(self, query, top_k=5, filters=None):
+        """retrieve() results from whichever replica answers first"""
+        candidates = self.ranked()
+        pending = {}
+        errors = []
+        while candidates or pending:
+            if candidates and len(pending) < 2:
+                region = candidates.pop(0)
+                pending[self.pool.submit(contextvars.copy_context().run, self._query, region, query, top_k, filters)] = region
+            # While one request is out, give it until its replica's p95 before hedging to the next
+            timeout = self.hedge_delay(next(iter(pending.values()))) if len(pending) == 1 and candidates else None
+            done, _ = wait_for_futures(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                self.hedges += 1
+            for future in done:
+                region = pending.pop(future)
+                if future.exception() is None:
+                    return future.result()
+                errors.append(f"{region}: {future.exception()}")
+        raise Exception(f"Every replica failed: {'; '.join(errors)}")
+
+    def stats(self):
+        """{region: {'p50', 'p95', 'error_rate', 'healthy'}}"""
+        now = self.clock.now()
+        with self.lock:
+            return {region: {'p50': self._percentile(region, 50), 'p95': self._percentile(region, 95),
+                             'error_rate': (self.outcomes[region].count(False) / len(self.outcomes[region])
+                                            if self.outcomes[region] else 0.0),
+                             'healthy': self.unhealthy_until[region] <= now}
+                    for region in self.replicas}
+
+_routers = {}
+
+def get_region_router(topic_base, regions=REPLICA_REGIONS):
+    """The RegionRouter for a topic's replicas, built from the ones that exist on first use"""
+    with _clients_lock:
+        router = _routers.get(topic_base)
+    if router is None:
+        replicas = find_knowledge_base_replicas(topic_base, regions)
+        if not replicas:
+            raise ValueError(f"No replicas of {topic_base} found in {', '.join(regions)}")
+        created = RegionRouter(replicas)
+        with _clients_lock:
+            router = _routers.setdefault(topic_base, created)
+        if router is not created:
+            created.close()
+    return router
+
+@tool
+def routed_retrieve(topic_base: str, query: str, top_k: int = 5) -> str:
+    """
+    Search the nearest healthy copy of a knowledge base that is replicated across AWS regions.
+
+    Args:
+        topic_base (str): The topic the knowledge base was created for, e.g. "hunting-alex".
+        query (str): The question or search text.
+        top_k (int): The number of chunks to return.
+
+    Returns:
+        str: The matching chunks with their scores and sources.
+    """
+    return format_results(get_region_router(topic_base).query(query, top_k))
 
 # 1. Cleanup existing KB
-def clean_up_knowledgebase(bedrock_agent, kb_name):
+@traced('cleanup', 'kb_name')
+def clean_up_knowledgebase(bedrock_agent, kb_name, clock=None):
+    index = get_kb_index(bedrock_agent)
+    kb_id = index.knowledge_base_id(kb_name, refresh=True)
+    if kb_id is None:
+        return
+    print(f"🗑️  Deleting existing KB: {kb_name}")
     try:
-        kbs = bedrock_agent.list_knowledge_bases()
-        for kb in kbs.get('knowledgeBaseSummaries', []):
-            if kb['name'] == kb_name:
-                print(f"🗑️  Deleting existing KB: {kb_name}")
-                bedrock_agent.delete_knowledge_base(knowledgeBaseId=kb['knowledgeBaseId'])
-                time.sleep(10)  # Wait for deletion
-                break
-    except:
-        pass
+        bedrock_agent.delete_knowledge_base(knowledgeBaseId=kb_id)
+        drop_lexical_index(kb_id)
+        drop_tables(kb_id)
+        wait_for_knowledge_base_deleted(bedrock_agent, kb_id, clock)
+    except ClientError as e:
+        if _error_code(e) not in NOT_FOUND_CODES:
+            raise
+    index.remove_knowledge_base(kb_name)
+    notify_knowledge_base_changed(kb_id)
 
 # 2. Create S3 bucket for documents and upload
+@traced('bucket', 'bucket_name')
 def create_s3_bucket(s3, bucket_name, region):
     print(f"📦 Creating S3 bucket for documents: {bucket_name}")
     try:
@@ -110,12 +1666,326 @@ def create_s3_bucket(s3, bucket_name, region):
         raise
     
 # Upload file to S3
-def upload_file(s3, bucket_name, source_file, target_file):
-    s3.upload_file(source_file, bucket_name, target_file)
-    print(f"✅ Uploaded to S3: {bucket_name}")
+# Multipart settings for document uploads - large scanned reports go up in parallel parts
+DEFAULT_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=8 * MB,
+    max_concurrency=4,
+    use_threads=True,
+)
+
+UploadResult = namedtuple('UploadResult', ['source', 'target', 'size', 'seconds', 'error'])
+
+class UploadProgress:
+    """Aggregate byte/file counter shared by every upload thread of a batch"""
+    def __init__(self, total_files, total_bytes, clock=None, report_every=5.0):
+        self.clock = clock or SYSTEM_CLOCK
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.report_every = report_every
+        self.files_done = 0
+        self.bytes_done = 0
+        self.started = self.clock.now()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        # boto3 transfer callback - called from the transfer threads
+        with self._lock:
+            self.bytes_done += bytes_amount
+            self._maybe_report()
+
+    def file_done(self):
+        with self._lock:
+            self.files_done += 1
+            self._maybe_report()
+
+    def elapsed(self):
+        return max(self.clock.now() - self.started, 1e-9)
+
+    def throughput(self):
+        return self.bytes_done / MB / self.elapsed()
+
+    def _maybe_report(self):
+        now = self.clock.now()
+        if now - self._last_report >= self.report_every:
+            self._last_report = now
+            print(f"⏳ Uploaded {self.files_done}/{self.total_files} files, "
+                  f"{self.bytes_done / MB:.1f}/{self.total_bytes / MB:.1f} MB ({self.throughput():.1f} MB/s)")
+
+@traced('upload', 'bucket_name')
+def upload_files(s3, bucket_name, files, max_workers=8, transfer_config=None, clock=None, extra_args=None):
+    """Upload many (source, target) pairs concurrently and return one UploadResult per file
+
+    extra_args optionally maps a target key to the ExtraArgs for its upload (e.g. object metadata).
+    """
+    clock = clock or SYSTEM_CLOCK
+    transfer_config = transfer_config or DEFAULT_TRANSFER_CONFIG
+    files = list(files)
+    if not files:
+        return []
+    sizes = {source: os.path.getsize(source) if os.path.exists(source) else 0 for source, _ in files}
+    progress = UploadProgress(len(files), sum(sizes.values()), clock)
+
+    def upload(source, target):
+        started = clock.now()
+        try:
+            s3.upload_file(source, bucket_name, target, Config=transfer_config, Callback=progress,
+                           ExtraArgs=(extra_args or {}).get(target))
+            error = None
+        except Exception as e:
+            error = e
+        progress.file_done()
+        return UploadResult(source, target, sizes[source], clock.now() - started, error)
+
+    print(f"📤 Uploading {len(files)} files to S3: {bucket_name}")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as pool:
+        futures = [pool.submit(upload, source, target) for source, target in files]
+        results = [future.result() for future in futures]
+
+    record(bytes_uploaded=progress.bytes_done)
+    failed = [r for r in results if r.error is not None]
+    print(f"✅ Uploaded {len(results) - len(failed)}/{len(results)} files "
+          f"({progress.bytes_done / MB:.1f} MB in {progress.elapsed():.1f}s, {progress.throughput():.1f} MB/s) to S3: {bucket_name}")
+    for r in failed:
+        print(f"❌ Failed to upload {r.source}: {r.error}")
+    return results
+
+def check_uploads(results):
+    """Fail only when nothing in the batch made it to S3 - partial failures are reported and skipped"""
+    if results and all(r.error is not None for r in results):
+        raise Exception(f"All {len(results)} uploads failed: {results[0].error}")
+    return results
+
+# Document metadata - a <key>.metadata.json sidecar next to each document holds the attributes
+# Bedrock attaches to every chunk of it, so retrieval can be narrowed to one state/animal/year.
+# Keys follow the notebooks' animal/state/year layout; pass layout= for buckets organised otherwise.
+METADATA_SUFFIX = '.metadata.json'
+DOCUMENT_KEY_LAYOUT = ('animal', 'state', 'year')
+FILTERABLE_METADATA_KEYS = ('state', 'animal', 'year')
+
+def metadata_from_key(key, layout=DOCUMENT_KEY_LAYOUT):
+    """{'animal': 'deer', 'state': 'utah', 'year': 2023} for deer/utah/2023.pdf, {} if the key doesn't fit"""
+    segments = key.split('/')
+    if len(segments) != len(layout):
+        return {}
+    segments[-1] = os.path.splitext(segments[-1])[0]
+    attributes = dict(zip(layout, segments))
+    if 'year' in attributes:
+        if not attributes['year'].isdigit():
+            return {}
+        attributes['year'] = int(attributes['year'])
+    return attributes
+
+def document_metadata(files, metadata=True, layout=None):
+    """{target: attributes}; metadata=True derives them from the keys, a {target: attributes} dict adds to that"""
+    if not metadata:
+        return {}
+    layout = layout or DOCUMENT_KEY_LAYOUT
+    attributes = {target: metadata_from_key(target, layout) for _, target in files}
+    if isinstance(metadata, dict):
+        for target, extra in metadata.items():
+            if target in attributes:
+                attributes[target] = dict(attributes[target], **extra)
+    return {target: values for target, values in attributes.items() if values}
+
+@traced('metadata', 'bucket_name')
+def upload_metadata(s3, bucket_name, metadata, max_workers=8):
+    """Write a .metadata.json sidecar for every {target: attributes} entry"""
+    if not metadata:
+        return
+    def put(item):
+        target, attributes = item
+        s3.put_object(
+            Bucket=bucket_name,
+            Key=target + METADATA_SUFFIX,
+            Body=json.dumps({'metadataAttributes': attributes}).encode('utf-8'),
+            ContentType='application/json'
+        )
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(metadata)))) as pool:
+        list(pool.map(put, metadata.items()))
+    print(f"🏷️  Wrote metadata for {len(metadata)} documents to S3: {bucket_name}")
+
+def metadata_filter(state=None, animal=None, year=None, **attributes):
+    """Bedrock retrieval filter matching every given attribute; a list of years matches any of them"""
+    conditions = []
+    for key, value in dict(attributes, state=state, animal=animal, year=year).items():
+        if value is None or value == '':
+            continue
+        if isinstance(value, str):
+            value = value.lower()
+        if isinstance(value, (list, tuple, set)):
+            conditions.append({'in': {'key': key, 'value': list(value)}})
+        else:
+            conditions.append({'equals': {'key': key, 'value': value}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {'andAll': conditions}
+
+# PDF pre-extraction - preprocess='replace' uploads each PDF's extracted markdown (deer/utah/2023.md)
+# in its place, preprocess='alongside' uploads both; see pdf_extraction
+@traced('extract')
+def prepare_documents(files, metadata=None, preprocess='replace', max_workers=None):
+    """(files, metadata) with PDFs swapped for their markdown and metadata keyed by the new targets"""
+    if preprocess is True:
+        preprocess = 'replace'
+    files, targets = preprocess_files(files, preprocess, max_workers)
+    if isinstance(metadata, dict):
+        metadata = dict(metadata, **{target: metadata[original] for target, original in targets.items()
+                                     if original in metadata})
+    return files, metadata
     
+# Sync manifest - content hashes of what is already in the topic bucket, kept either
+# in a local JSON file or as object metadata on the uploaded documents
+MANIFEST_METADATA_KEY = 'sha256'
+
+class SyncPlan(namedtuple('SyncPlan', ['upload', 'delete', 'unchanged', 'hashes'])):
+    """upload: (source, target) pairs, delete/unchanged: target keys, hashes: target -> sha256"""
+    def is_empty(self):
+        return not self.upload and not self.delete
+
+def file_sha256(path, chunk_size=MB):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(s3, bucket_name, manifest_path=None, keys=None, max_workers=16):
+    """Return {target key: sha256} for the documents already in the bucket"""
+    if manifest_path:
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    # Listing tells us what exists; only objects we might skip need a HEAD for their hash
+    existing = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket_name):
+        existing.extend(obj['Key'] for obj in page.get('Contents', []) if not obj['Key'].endswith(METADATA_SUFFIX))
+    to_check = [key for key in existing if keys is None or key in keys]
+
+    def head(key):
+        metadata = s3.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+        return metadata.get(MANIFEST_METADATA_KEY, '')
+
+    manifest = {key: '' for key in existing}
+    if to_check:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_check)))) as pool:
+            manifest.update(zip(to_check, pool.map(head, to_check)))
+    return manifest
+
+def save_manifest(manifest_path, manifest):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def file_hashes(files, max_workers=8):
+    """{target: sha256} for (source, target) pairs, hashed concurrently"""
+    files = list(files)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files) or 1))) as pool:
+        return dict(zip([target for _, target in files], pool.map(file_sha256, [source for source, _ in files])))
+
+def plan_sync(manifest, files, delete_missing=False, max_workers=8, hashes=None):
+    """Compare local files against the manifest and work out the delta (hashes: precomputed file_hashes)"""
+    files = list(files)
+    hashes = hashes if hashes is not None else file_hashes(files, max_workers)
+    hashes = {target: hashes[target] for _, target in files}
+    upload = [(source, target) for source, target in files if manifest.get(target) != hashes[target]]
+    unchanged = [target for _, target in files if manifest.get(target) == hashes[target]]
+    delete = sorted(set(manifest) - set(hashes)) if delete_missing else []
+    return SyncPlan(upload, delete, unchanged, hashes)
+
+def delete_objects(s3, bucket_name, keys):
+    keys = list(keys)
+    for i in range(0, len(keys), 1000):
+        s3.delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]], 'Quiet': True}
+        )
+    if keys:
+        print(f"🗑️  Deleted {len(keys)} removed documents from S3: {bucket_name}")
+
+def hash_extra_args(files, hashes):
+    """upload_files extra_args recording each file's sha256 on its object"""
+    return {target: {'Metadata': {MANIFEST_METADATA_KEY: hashes[target]}} for _, target in files}
+
+def upload_tracked_files(s3, bucket_name, files, manifest_path=None, max_workers=8, clock=None, hashes=None):
+    """Upload every file with its sha256 recorded (and saved to manifest_path) so later syncs can skip it"""
+    files = list(files)
+    hashes = hashes if hashes is not None else file_hashes(files, max_workers)
+    results = check_uploads(upload_files(s3, bucket_name, files, max_workers, clock=clock,
+                                         extra_args=hash_extra_args(files, hashes)))
+    if manifest_path:
+        manifest = load_manifest(s3, bucket_name, manifest_path)
+        manifest.update({r.target: hashes[r.target] for r in results if r.error is None})
+        save_manifest(manifest_path, manifest)
+    return results
+
+@traced('sync', 'bucket_name')
+def sync_files(s3, bucket_name, files, manifest_path=None, delete_missing=False, max_workers=8, clock=None,
+               hashes=None):
+    """Upload only new or changed files (and optionally delete removed ones), returning the SyncPlan"""
+    files = list(files)
+    targets = {target for _, target in files}
+    manifest = load_manifest(s3, bucket_name, manifest_path, keys=targets)
+    plan = plan_sync(manifest, files, delete_missing, max_workers, hashes)
+    print(f"🔍 Sync plan for {bucket_name}: {len(plan.upload)} to upload, "
+          f"{len(plan.delete)} to delete, {len(plan.unchanged)} unchanged")
+    if plan.is_empty():
+        return plan
+
+    results = check_uploads(upload_files(s3, bucket_name, plan.upload, max_workers, clock=clock,
+                                         extra_args=hash_extra_args(plan.upload, plan.hashes)))
+    # Sidecars go with their documents (deleting a missing key is a no-op)
+    delete_objects(s3, bucket_name, plan.delete + [key + METADATA_SUFFIX for key in plan.delete])
+
+    for r in results:
+        if r.error is None:
+            manifest[r.target] = plan.hashes[r.target]
+    for key in plan.delete:
+        manifest.pop(key, None)
+    if manifest_path:
+        save_manifest(manifest_path, manifest)
+    return plan
+
+# Embedding profiles - the model, vector size and metric that the index, the role's InvokeModel
+# permission and the KB's embedding configuration must all agree on
+class EmbeddingProfile(namedtuple('EmbeddingProfile', ['model_id', 'dimension', 'distance_metric'])):
+    """model_id e.g. amazon.titan-embed-text-v2:0, dimension 256/512/1024, distance_metric cosine/euclidean"""
+    def model_arn(self, region):
+        return f"arn:aws:bedrock:{region}::foundation-model/{self.model_id}"
+
+# Titan Text Embeddings V2 supports three output sizes - smaller vectors store and search cheaper
+TITAN_V2_1024 = EmbeddingProfile('amazon.titan-embed-text-v2:0', 1024, 'cosine')
+TITAN_V2_512 = EmbeddingProfile('amazon.titan-embed-text-v2:0', 512, 'cosine')
+TITAN_V2_256 = EmbeddingProfile('amazon.titan-embed-text-v2:0', 256, 'cosine')
+EMBEDDING_PROFILES = {
+    'titan-v2-1024': TITAN_V2_1024,
+    'titan-v2-512': TITAN_V2_512,
+    'titan-v2-256': TITAN_V2_256,
+}
+DEFAULT_EMBEDDING_PROFILE = TITAN_V2_1024
+
 # 3. Create S3 Vector Bucket
-def create_s3_vector_bucket(s3vectors_client, region, account_id, vector_bucket_name, vector_index_name):
+def vector_index_config(embedding_profile=None):
+    """create_index arguments for a Bedrock-compatible vector index"""
+    profile = embedding_profile or DEFAULT_EMBEDDING_PROFILE
+    return {
+        'dataType': 'float32',  # Required parameter
+        'dimension': profile.dimension,  # Must match the embedding model's output (singular, not plural)
+        'distanceMetric': profile.distance_metric,  # Lowercase, cosine recommended for Titan embeddings
+        'metadataConfiguration': {  # Correct structure
+            # Keys not listed here are filterable (FILTERABLE_METADATA_KEYS from the sidecars); filterable
+            # metadata is size-limited per vector, so text and URLs stay out of it
+            'nonFilterableMetadataKeys': ['AMAZON_BEDROCK_TEXT', 'source_url']  # Required for large text chunks
+        }
+    }
+
+@traced('vector_index', 'vector_index_name')
+def create_s3_vector_bucket(s3vectors_client, region, account_id, vector_bucket_name, vector_index_name, clock=None,
+                            embedding_profile=None):
     print(f"🎯 Creating S3 vector bucket: {vector_bucket_name}")
     try:
         # Delete existing vector bucket if it exists
@@ -124,8 +1994,8 @@ def create_s3_vector_bucket(s3vectors_client, region, account_id, vector_bucket_
                 vectorBucketName=vector_bucket_name
             )
             print(f"🗑️  Deleted existing vector bucket")
-            time.sleep(15)  # Wait for deletion to complete
-        except:
+            wait_for_vector_bucket_deleted(s3vectors_client, vector_bucket_name, clock)
+        except ClientError:
             pass
         
         # Create new vector bucket
@@ -141,7 +2011,7 @@ def create_s3_vector_bucket(s3vectors_client, region, account_id, vector_bucket_
         
         # Wait for vector bucket to be active
         print("⏳ Waiting for vector bucket to be active...")
-        time.sleep(5)
+        wait_for_vector_bucket(s3vectors_client, vector_bucket_name, clock)
         
     except Exception as e:
         if "already exists" in str(e):
@@ -160,43 +2030,36 @@ def create_s3_vector_bucket(s3vectors_client, region, account_id, vector_bucket_
                 indexName=vector_index_name
             )
             print(f"🗑️  Deleted existing vector index")
-            time.sleep(10)  # Wait for deletion
-        except:
+            wait_for_vector_index_deleted(s3vectors_client, vector_bucket_name, vector_index_name, clock)
+        except ClientError:
             pass
         
         # Create vector index with proper configuration for Bedrock
         vector_index_response = s3vectors_client.create_index(
             vectorBucketName=vector_bucket_name,  # Use bucket name, not ARN
             indexName=vector_index_name,  # Correct parameter name
-            dataType='float32',  # Required parameter
-            dimension=1024,  # Amazon Titan Text Embeddings V2 dimensions (singular, not plural)
-            distanceMetric='cosine',  # Lowercase, recommended for Titan embeddings
-            metadataConfiguration={  # Correct structure
-                'nonFilterableMetadataKeys': ['AMAZON_BEDROCK_TEXT']  # Required for large text chunks
-            }
+            **vector_index_config(embedding_profile)
         )
         vector_index_arn = f"arn:aws:s3vectors:{region}:{account_id}:bucket/{vector_bucket_name}/index/{vector_index_name}"
         print(f"✅ Created vector index: {vector_index_name}")
         
         # Wait for index to be ready
         print("⏳ Waiting for vector index to be ready...")
-        time.sleep(10)
+        wait_for_vector_index(s3vectors_client, vector_bucket_name, vector_index_name, clock)
         return vector_index_arn
         
     except Exception as e:
         if "already exists" in str(e):
             vector_index_arn = f"arn:aws:s3vectors:{region}:{account_id}:bucket/{vector_bucket_name}/index/{vector_index_name}"
             print(f"✅ Using existing vector index: {vector_index_name}")
+            return vector_index_arn
         else:
             print(f"❌ Error creating vector index: {e}")
             raise
 
-def create_bedrock_iam(iam_client, role_name, bucket_name, region):
-    # 5. Create IAM role for Bedrock Knowledge Base
-    print(f"🔑 Creating IAM role for Bedrock: {role_name}")
-    
+def bedrock_trust_policy():
     # Trust policy - allows bedrock.amazonaws.com to assume this role
-    trust_policy = {
+    return {
         "Version": "2012-10-17",
         "Statement": [
             {
@@ -208,9 +2071,10 @@ def create_bedrock_iam(iam_client, role_name, bucket_name, region):
             }
         ]
     }
-    
+
+def bedrock_permissions_policy(bucket_name, region, embedding_profile=None):
     # Permissions policy - what the role can do
-    permissions_policy = {
+    return {
         "Version": "2012-10-17",
         "Statement": [
             {
@@ -236,10 +2100,17 @@ def create_bedrock_iam(iam_client, role_name, bucket_name, region):
                 "Action": [
                     "bedrock:InvokeModel"
                 ],
-                "Resource": f"arn:aws:bedrock:{region}::foundation-model/amazon.titan-embed-text-v2:0"
+                "Resource": (embedding_profile or DEFAULT_EMBEDDING_PROFILE).model_arn(region)
             }
         ]
     }
+
+@traced('iam_role', 'role_name')
+def create_bedrock_iam(iam_client, role_name, bucket_name, region, clock=None, embedding_profile=None):
+    # 5. Create IAM role for Bedrock Knowledge Base
+    print(f"🔑 Creating IAM role for Bedrock: {role_name}")
+    trust_policy = bedrock_trust_policy()
+    permissions_policy = bedrock_permissions_policy(bucket_name, region, embedding_profile)
     
     try:
         # Try to create the role
@@ -259,9 +2130,9 @@ def create_bedrock_iam(iam_client, role_name, bucket_name, region):
         )
         print(f"✅ Attached permissions policy")
         
-        # Wait for the role to propagate
+        # Wait for the role to propagate - Bedrock's own check happens in create_bedrock_knowledge_base
         print("⏳ Waiting for IAM role to propagate...")
-        time.sleep(15)  # Increased wait time
+        wait_for_role(iam_client, role_name, clock)
         return role_arn
         
     except iam_client.exceptions.EntityAlreadyExistsException:
@@ -281,34 +2152,53 @@ def create_bedrock_iam(iam_client, role_name, bucket_name, region):
         print(f"❌ Error creating/updating IAM role: {e}")
         raise
 
-def create_bedrock_knowledge_base(bedrock_agent_client, kb_name, region, role_arn, vector_index_arn):
+def knowledge_base_configuration(region, embedding_profile=None):
+    profile = embedding_profile or DEFAULT_EMBEDDING_PROFILE
+    return {
+        'type': 'VECTOR',
+        'vectorKnowledgeBaseConfiguration': {
+            'embeddingModelArn': profile.model_arn(region),
+            'embeddingModelConfiguration': {
+                'bedrockEmbeddingModelConfiguration': {
+                    'dimensions': profile.dimension
+                }
+            }
+        }
+    }
+
+def storage_configuration(vector_index_arn):
+    return {
+        'type': 'S3_VECTORS',
+        's3VectorsConfiguration': {
+            'indexArn': vector_index_arn
+        }
+    }
+
+@traced('knowledge_base', 'kb_name')
+def create_bedrock_knowledge_base(bedrock_agent_client, kb_name, region, role_arn, vector_index_arn, clock=None,
+                                  embedding_profile=None):
     # 6. Create Knowledge Base with S3 Vectors
     print("📝 Creating Knowledge Base with S3 Vectors...")
+    def create():
+        try:
+            return bedrock_agent_client.create_knowledge_base(
+                name=kb_name,
+                description=f"Knowledge base: {kb_name} using S3 Vectors",
+                roleArn=role_arn,
+                knowledgeBaseConfiguration=knowledge_base_configuration(region, embedding_profile),
+                storageConfiguration=storage_configuration(vector_index_arn)
+            )
+        except ClientError as e:
+            # A freshly created role is rejected until IAM has propagated it to Bedrock
+            if _is_role_not_ready(e):
+                print("⏳ IAM role not usable by Bedrock yet, retrying...")
+                record(retries=1)
+                return None
+            raise
     try:
-        kb_response = bedrock_agent_client.create_knowledge_base(
-            name=kb_name,
-            description=f"Knowledge base: {kb_name} using S3 Vectors",
-            roleArn=role_arn,
-            knowledgeBaseConfiguration={
-                'type': 'VECTOR',
-                'vectorKnowledgeBaseConfiguration': {
-                    'embeddingModelArn': f'arn:aws:bedrock:{region}::foundation-model/amazon.titan-embed-text-v2:0',
-                    'embeddingModelConfiguration': {
-                        'bedrockEmbeddingModelConfiguration': {
-                            'dimensions': 1024
-                        }
-                    }
-                }
-            },
-            storageConfiguration={
-                'type': 'S3_VECTORS',
-                's3VectorsConfiguration': {
-                    'indexArn': vector_index_arn
-                }
-            }
-        )
-        
+        kb_response = wait_until(create, 'role', clock)
         kb_id = kb_response['knowledgeBase']['knowledgeBaseId']
+        get_kb_index(bedrock_agent_client).add_knowledge_base(kb_name, kb_id)
         print(f"✅ Knowledge Base created: {kb_id}")
         
     except Exception as e:
@@ -317,122 +2207,920 @@ def create_bedrock_knowledge_base(bedrock_agent_client, kb_name, region, role_ar
     
     # Wait for KB to be active
     print("⏳ Waiting for Knowledge Base to be active...")
-    while True:
-        kb_status = bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)
-        status = kb_status['knowledgeBase']['status']
-        if status == 'ACTIVE':
-            print("✅ Knowledge Base is active")
-            break
-        elif status == 'FAILED':
-            raise Exception(f"Knowledge Base creation failed: {kb_status}")
-        time.sleep(10)
+    wait_for_knowledge_base_active(bedrock_agent_client, kb_id, clock)
+    print("✅ Knowledge Base is active")
     return kb_id
 
-def add_data_source_to_knowledge_base(bedrock_agent, kb_name, bucket_name, kb_id):
+def data_source_configuration(bucket_name, inclusion_prefixes=None):
+    configuration = {
+        'type': 'S3',
+        's3Configuration': {
+            'bucketArn': f'arn:aws:s3:::{bucket_name}' # Only process our specific file
+        }
+    }
+    if inclusion_prefixes:
+        configuration['s3Configuration']['inclusionPrefixes'] = list(inclusion_prefixes)
+    return configuration
+
+@traced('data_source', 'kb_name')
+def add_data_source_to_knowledge_base(bedrock_agent, kb_name, bucket_name, kb_id, clock=None, wait=True):
     # 7. Create data source and ingest
     print("📊 Creating data source...")
     ds_response = bedrock_agent.create_data_source(
         knowledgeBaseId=kb_id,
         name=f"{kb_name}-datasource",
         description="S3 data source",
-        dataSourceConfiguration={
-            'type': 'S3',
-            's3Configuration': {
-                'bucketArn': f'arn:aws:s3:::{bucket_name}' # Only process our specific file
-            }
-        }
+        dataSourceConfiguration=data_source_configuration(bucket_name)
     )
     
     ds_id = ds_response['dataSource']['dataSourceId']
+    get_kb_index(bedrock_agent).add_data_source(kb_id, f"{kb_name}-datasource", ds_id)
     print(f"✅ Data source created: {ds_id}")
     
     # 8. Start ingestion job
-    print("🔄 Starting ingestion job...")
-    job_response = bedrock_agent.start_ingestion_job(
-        knowledgeBaseId=kb_id,
-        dataSourceId=ds_id
-    )
-    job_id = job_response['ingestionJob']['ingestionJobId']
+    job = start_ingestion(bedrock_agent, kb_id, ds_id, get_ingestion_monitor(clock))
     
     # Wait for ingestion to complete
-    print("⏳ Waiting for ingestion to complete...")
-    while True:
-        job_status = bedrock_agent.get_ingestion_job(
-            knowledgeBaseId=kb_id,
-            dataSourceId=ds_id,
-            ingestionJobId=job_id
-        )
-        status = job_status['ingestionJob']['status']
-        
-        if status == 'COMPLETE':
-            print("✅ Ingestion completed successfully")
-            break
-        elif status == 'FAILED':
-            failure_reasons = job_status['ingestionJob'].get('failureReasons', ['Unknown error'])
-            raise Exception(f"Ingestion failed: {failure_reasons}")
-        elif status in ['IN_PROGRESS', 'STARTING']:
-            print(f"⏳ Ingestion status: {status}")
-            time.sleep(15)
-        else:
-            print(f"❓ Unexpected status: {status}")
-            time.sleep(10)
+    if wait:
+        print("⏳ Waiting for ingestion to complete...")
+        follow_ingestion(job, kb_id)
+        print("✅ Ingestion completed successfully")
+    return job
+
+def find_data_source_id(bedrock_agent, kb_id, ds_name):
+    index = get_kb_index(bedrock_agent)
+    return index.data_source_id(kb_id, ds_name) or index.data_source_id(kb_id, ds_name, refresh=True)
 
-def update_data_source(bedrock_agent, kb_name, bucket_name, kb_id):
+@traced('data_source', 'kb_name')
+def update_data_source(bedrock_agent, kb_name, bucket_name, kb_id, clock=None, wait=True):
     # 8. Update data source and ingest
     print("📊 Updating data source...")
-    response = bedrock_agent.list_data_sources(knowledgeBaseId=kb_id)
     ds_name = f"{kb_name}-datasource"
-    ds_id = None
-    for ds in response.get('dataSourceSummaries', []):
-            if ds['name'] == ds_name:
-                ds_id = ds['dataSourceId']
+    ds_id = find_data_source_id(bedrock_agent, kb_id, ds_name)
 
     if ds_id is None:
+        if partition_data_sources(bedrock_agent, kb_name, kb_id):
+            raise ValueError(f"{kb_name} ingests through partition data sources, use ingest_partitions "
+                             f"(or update with partitioned=True)")
         print(f"✅ Data source Not Found: {ds_id}")
-        return kb_id
+        return None
     print(f"✅ Data Found: {ds_id}")
     ds_response = bedrock_agent.update_data_source(
         knowledgeBaseId=kb_id,
         dataSourceId=ds_id,
         name=ds_name,
         description="S3 data source",
-        dataSourceConfiguration={
-            'type': 'S3',
-            's3Configuration': {
-                'bucketArn': f'arn:aws:s3:::{bucket_name}' # Only process our specific file
-            }
-        }
+        dataSourceConfiguration=data_source_configuration(bucket_name)
     )
     
     # 8. Start ingestion job
-    print("🔄 Starting ingestion job...")
-    job_response = bedrock_agent.start_ingestion_job(
-        knowledgeBaseId=kb_id,
-        dataSourceId=ds_id
-    )
-    job_id = job_response['ingestionJob']['ingestionJobId']
+    job = start_ingestion(bedrock_agent, kb_id, ds_id, get_ingestion_monitor(clock))
     
     # Wait for ingestion to complete
-    print("⏳ Waiting for ingestion to complete...")
-    while True:
-        job_status = bedrock_agent.get_ingestion_job(
+    if wait:
+        print("⏳ Waiting for ingestion to complete...")
+        follow_ingestion(job, kb_id)
+        print("✅ Ingestion completed successfully")
+    return job
+
+# Direct ingestion - push just the changed documents through the document-level APIs instead of
+# a data source sync that rescans the whole bucket; big change sets still go through a full sync
+DIRECT_INGESTION_BATCH_SIZE = 10     # documents per ingest/delete/get call - the most the APIs accept
+DIRECT_INGESTION_THRESHOLD = 100     # above this many changed documents a full sync is cheaper
+DOCUMENT_INDEXED_STATUSES = {'INDEXED', 'PARTIALLY_INDEXED', 'METADATA_PARTIALLY_INDEXED'}
+DOCUMENT_DONE_STATUSES = DOCUMENT_INDEXED_STATUSES | {'FAILED', 'METADATA_UPDATE_FAILED', 'IGNORED', 'NOT_FOUND'}
+DOCUMENT_FAILED_STATUSES = {'FAILED', 'METADATA_UPDATE_FAILED'}
+
+class DocumentResult(namedtuple('DocumentResult', ['key', 'action', 'status', 'reason'])):
+    @property
+    def failed(self):
+        # A deleted document reads back as NOT_FOUND; an ingested one has to end up indexed
+        if self.action == 'delete':
+            return self.status in DOCUMENT_FAILED_STATUSES
+        return self.status not in DOCUMENT_INDEXED_STATUSES
+
+def _document_identifier(bucket_name, key):
+    return {'dataSourceType': 'S3', 's3': {'uri': f"s3://{bucket_name}/{key}"}}
+
+def _batches(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+@traced('direct_ingestion', 'kb_id')
+def ingest_documents(bedrock_agent, kb_id, ds_id, bucket_name, upload_keys=(), delete_keys=(), clock=None,
+                     batch_size=DIRECT_INGESTION_BATCH_SIZE, metadata_keys=()):
+    """Ingest/delete individual S3 documents and wait for each one; returns one DocumentResult per key
+
+    Keys in metadata_keys are ingested together with their .metadata.json sidecar.
+    """
+    prefix = f"s3://{bucket_name}/"
+    actions = dict.fromkeys(upload_keys, 'ingest')
+    actions.update(dict.fromkeys(delete_keys, 'delete'))
+    statuses, reasons = {}, {}
+
+    def track(details):
+        for detail in details:
+            key = detail['identifier']['s3']['uri'][len(prefix):]
+            statuses[key] = detail.get('status')
+            reasons[key] = detail.get('statusReason')
+
+    def document(key):
+        content = {'content': {'dataSourceType': 'S3', 's3': {'s3Location': {'uri': prefix + key}}}}
+        if key in metadata_keys:
+            content['metadata'] = {'type': 'S3_LOCATION', 's3Location': {'uri': prefix + key + METADATA_SUFFIX}}
+        return content
+
+    print(f"📥 Directly ingesting {len(upload_keys)} and deleting {len(delete_keys)} documents in {kb_id}")
+    for batch in _batches(list(upload_keys), batch_size):
+        track(bedrock_agent.ingest_knowledge_base_documents(
+            knowledgeBaseId=kb_id,
+            dataSourceId=ds_id,
+            documents=[document(key) for key in batch]
+        ).get('documentDetails', []))
+    for batch in _batches(list(delete_keys), batch_size):
+        track(bedrock_agent.delete_knowledge_base_documents(
+            knowledgeBaseId=kb_id,
+            dataSourceId=ds_id,
+            documentIdentifiers=[_document_identifier(bucket_name, key) for key in batch]
+        ).get('documentDetails', []))
+
+    def all_done():
+        pending = [key for key in actions if statuses.get(key) not in DOCUMENT_DONE_STATUSES]
+        for batch in _batches(pending, batch_size):
+            track(bedrock_agent.get_knowledge_base_documents(
+                knowledgeBaseId=kb_id,
+                dataSourceId=ds_id,
+                documentIdentifiers=[_document_identifier(bucket_name, key) for key in batch]
+            ).get('documentDetails', []))
+        return all(statuses.get(key) in DOCUMENT_DONE_STATUSES for key in actions)
+
+    try:
+        wait_until(all_done, 'documents', clock, initial_delay=2.0, max_delay=10.0)
+    finally:
+        # Even if waiting gave up, whatever was accepted is (or soon will be) in the index
+        notify_knowledge_base_changed(kb_id)
+    return [DocumentResult(key, action, statuses.get(key), reasons.get(key)) for key, action in actions.items()]
+
+def check_documents(results):
+    """Report failed documents on the current ProvisioningReport and raise if there are any"""
+    failed = [r for r in results if r.failed]
+    print(f"✅ Directly ingested {len(results) - len(failed)}/{len(results)} documents")
+    if not failed:
+        return results
+    for r in failed:
+        print(f"❌ Failed to {r.action} {r.key}: {r.status} {r.reason or ''}")
+    report = _current_report.get()
+    if report is not None:
+        report.add_failed_documents(failed)
+    raise Exception(f"{len(failed)}/{len(results)} documents failed to {'/'.join(sorted({r.action for r in failed}))} "
+                    f"(run a full update to retry them): {', '.join(r.key for r in failed)}")
+
+# Partitioned data sources - documents live under animal/state/year keys and every animal/state
+# prefix gets its own data source, so ingestion only scans the partitions that changed. A KB
+# runs one ingestion job at a time, so partitions are ingested one after another
+PARTITION_DEPTH = 2                   # key segments that make up a partition (animal/state)
+MAX_PARTITIONS = 5                    # Bedrock's default quota of data sources per knowledge base
+INGESTION_BUSY_CODES = ('ConflictException', 'ServiceQuotaExceededException')
+
+def document_key(state, animal, year, extension='pdf', layout=DOCUMENT_KEY_LAYOUT):
+    """Partitioned S3 key for a report, e.g. deer/utah/2023.pdf"""
+    values = {'state': state.lower(), 'animal': animal.lower(), 'year': year}
+    return '/'.join(str(values[field]) for field in layout) + f".{extension}"
+
+def partition_of(key, depth=PARTITION_DEPTH):
+    segments = key.split('/')[:-1]
+    if len(segments) < depth:
+        raise ValueError(f"Partitioned knowledge bases need keys at least {depth} folders deep "
+                         f"(e.g. {document_key('utah', 'deer', 2023)}), got {key!r}")
+    return '/'.join(segments[:depth])
+
+def check_partitions(kb_name, partitions, existing=()):
+    """Fail before anything is created if partitions plus existing partition data sources exceed the quota"""
+    names = set(existing) | {partition_data_source_name(kb_name, partition) for partition in partitions}
+    if len(names) > MAX_PARTITIONS:
+        raise ValueError(f"Partitioned knowledge bases get one data source per partition and Bedrock allows "
+                         f"{MAX_PARTITIONS} per knowledge base, but these documents need {len(names)} "
+                         f"({', '.join(sorted(partitions))}); use fewer prefixes or partitioned=False")
+
+def partition_data_source_name(kb_name, partition):
+    # Data source names only allow letters, digits and single - or _ separators
+    return re.sub(r'[^0-9A-Za-z]+', '-', f"{kb_name}-{partition}").strip('-')[:100]
+
+def partition_data_sources(bedrock_agent, kb_name, kb_id):
+    """{ds_name: ds_id} of the partition data sources ingest_partitions created for a KB"""
+    prefix = partition_data_source_name(kb_name, '') + '-'
+    sources = get_kb_index(bedrock_agent).data_sources(kb_id)
+    return {name: ds_id for name, ds_id in sources.items()
+            if name.startswith(prefix) and name != f"{kb_name}-datasource"}
+
+def find_partition_data_source(bedrock_agent, kb_name, bucket_name, kb_id, partition):
+    """Return the data source ID for a partition, creating it (limited to the partition's prefix) if needed"""
+    ds_name = partition_data_source_name(kb_name, partition)
+    ds_id = find_data_source_id(bedrock_agent, kb_id, ds_name)
+    if ds_id is None:
+        ds_id = bedrock_agent.create_data_source(
+            knowledgeBaseId=kb_id,
+            name=ds_name,
+            description=f"S3 data source for {partition}",
+            dataSourceConfiguration=data_source_configuration(bucket_name, [partition + '/'])
+        )['dataSource']['dataSourceId']
+        get_kb_index(bedrock_agent).add_data_source(kb_id, ds_name, ds_id)
+        print(f"✅ Data source created for {partition}: {ds_id}")
+    return ds_id
+
+def _start_when_free(bedrock_agent, kb_id, ds_id, clock=None):
+    # Bedrock runs a limited number of ingestion jobs per KB; extra partitions queue up here
+    def start():
+        try:
+            return start_ingestion(bedrock_agent, kb_id, ds_id, get_ingestion_monitor(clock))
+        except ClientError as e:
+            if _error_code(e) in INGESTION_BUSY_CODES:
+                record(retries=1)
+                return None
+            raise
+    return wait_until(start, 'ingestion_job', clock, initial_delay=5.0, max_delay=30.0)
+
+@traced('partitions', 'kb_name')
+def ingest_partitions(bedrock_agent, kb_name, bucket_name, kb_id, partitions, clock=None, wait=True):
+    """Make sure every partition has a data source and ingest them one after another; returns {partition: job}
+
+    Each job starts once the one before it finished; with wait=False only the last is still running.
+    """
+    partitions = sorted(set(partitions))
+    if not partitions:
+        return {}
+    print(f"📊 Ingesting {len(partitions)} partitions: {', '.join(partitions)}")
+    jobs = {}
+    for partition in partitions:
+        ds_id = find_partition_data_source(bedrock_agent, kb_name, bucket_name, kb_id, partition)
+        job = jobs[partition] = _start_when_free(bedrock_agent, kb_id, ds_id, clock)
+        if wait or partition != partitions[-1]:
+            follow_ingestion(job, partition)
+    if wait:
+        print(f"✅ Ingested {len(jobs)} partitions")
+    return jobs
+
+def ingest_partition_documents(bedrock_agent, kb_name, bucket_name, kb_id, upload_keys, delete_keys, clock=None,
+                               metadata_keys=()):
+    """Direct-ingest changed documents through their partitions' data sources"""
+    results = []
+    for partition in sorted({partition_of(key) for key in list(upload_keys) + list(delete_keys)}):
+        ds_id = find_partition_data_source(bedrock_agent, kb_name, bucket_name, kb_id, partition)
+        results.extend(ingest_documents(bedrock_agent, kb_id, ds_id, bucket_name,
+                                        [key for key in upload_keys if partition_of(key) == partition],
+                                        [key for key in delete_keys if partition_of(key) == partition], clock,
+                                        metadata_keys=metadata_keys))
+    return results
+
+# Reconcile - compare what exists with what create would build and only touch what is missing
+# or drifted, so re-running create against an up-to-date deployment keeps every embedding
+INDEX_RECREATE_FIELDS = ('dimension', 'distanceMetric')
+
+def _describe(call, **kwargs):
+    """The response of a get_* call, or None if the resource doesn't exist"""
+    try:
+        return call(**kwargs)
+    except ClientError as e:
+        if _error_code(e) in NOT_FOUND_CODES:
+            return None
+        raise
+
+def _policy(document):
+    # IAM hands policies back URL-encoded (botocore usually decodes them to a dict already)
+    if isinstance(document, str):
+        document = json.loads(urllib.parse.unquote(document))
+    return document
+
+@traced('vector_index', 'vector_index_name')
+def reconcile_vector_index(s3vectors_client, bedrock_agent, region, account_id, vector_bucket_name, vector_index_name,
+                           kb_name, changes, clock=None, embedding_profile=None):
+    """Create the vector bucket/index if missing; recreate the index only if dimension or metric changed"""
+    vector_index_arn = f"arn:aws:s3vectors:{region}:{account_id}:bucket/{vector_bucket_name}/index/{vector_index_name}"
+    desired = vector_index_config(embedding_profile)
+    if _describe(s3vectors_client.get_vector_bucket, vectorBucketName=vector_bucket_name) is None:
+        print(f"🎯 Creating S3 vector bucket: {vector_bucket_name}")
+        s3vectors_client.create_vector_bucket(vectorBucketName=vector_bucket_name,
+                                              encryptionConfiguration={'sseType': 'AES256'})
+        wait_for_vector_bucket(s3vectors_client, vector_bucket_name, clock)
+        changes.append(f"created vector bucket {vector_bucket_name}")
+
+    existing = _describe(s3vectors_client.get_index, vectorBucketName=vector_bucket_name, indexName=vector_index_name)
+    if existing is not None:
+        current = existing['index']
+        drifted = [field for field in INDEX_RECREATE_FIELDS if current.get(field) != desired[field]]
+        if not drifted:
+            if current.get('metadataConfiguration', {}) != desired['metadataConfiguration']:
+                print(f"⚠️  Vector index metadata configuration differs but can't be changed in place: {vector_index_name}")
+            print(f"✅ Vector index up to date: {vector_index_name}")
+            return vector_index_arn
+        # The KB still points at the index and its vectors are useless after this anyway
+        print(f"🔄 Vector index {', '.join(drifted)} changed, recreating: {vector_index_name}")
+        clean_up_knowledgebase(bedrock_agent, kb_name, clock)
+        s3vectors_client.delete_index(vectorBucketName=vector_bucket_name, indexName=vector_index_name)
+        wait_for_vector_index_deleted(s3vectors_client, vector_bucket_name, vector_index_name, clock)
+        changes.append(f"recreated vector index {vector_index_name} ({', '.join(drifted)} changed)")
+    else:
+        changes.append(f"created vector index {vector_index_name}")
+
+    print(f"📍 Creating vector index: {vector_index_name}")
+    s3vectors_client.create_index(vectorBucketName=vector_bucket_name, indexName=vector_index_name, **desired)
+    wait_for_vector_index(s3vectors_client, vector_bucket_name, vector_index_name, clock)
+    return vector_index_arn
+
+@traced('iam_role', 'role_name')
+def reconcile_bedrock_iam(iam_client, role_name, bucket_name, region, changes, clock=None, embedding_profile=None):
+    """Create the role if missing, otherwise only rewrite the policies that drifted"""
+    role = _describe(iam_client.get_role, RoleName=role_name)
+    if role is None:
+        changes.append(f"created IAM role {role_name}")
+        return create_bedrock_iam(iam_client, role_name, bucket_name, region, clock, embedding_profile)
+
+    if _policy(role['Role'].get('AssumeRolePolicyDocument')) != bedrock_trust_policy():
+        iam_client.update_assume_role_policy(RoleName=role_name, PolicyDocument=json.dumps(bedrock_trust_policy()))
+        changes.append(f"updated trust policy of {role_name}")
+    policy_name = f"{role_name}-permissions"
+    desired = bedrock_permissions_policy(bucket_name, region, embedding_profile)
+    current = _describe(iam_client.get_role_policy, RoleName=role_name, PolicyName=policy_name)
+    if current is None or _policy(current['PolicyDocument']) != desired:
+        iam_client.put_role_policy(RoleName=role_name, PolicyName=policy_name, PolicyDocument=json.dumps(desired))
+        changes.append(f"updated permissions policy of {role_name}")
+    print(f"✅ IAM role reconciled: {role_name}")
+    return role['Role']['Arn']
+
+def _knowledge_base_drift(current, region, vector_index_arn, embedding_profile=None):
+    # Compare only the fields we set - the service fills in defaults for the rest
+    desired = knowledge_base_configuration(region, embedding_profile)['vectorKnowledgeBaseConfiguration']
+    actual = current.get('knowledgeBaseConfiguration', {}).get('vectorKnowledgeBaseConfiguration', {})
+    dimensions = lambda config: (config.get('embeddingModelConfiguration', {})
+                                 .get('bedrockEmbeddingModelConfiguration', {}).get('dimensions'))
+    actual_index = current.get('storageConfiguration', {}).get('s3VectorsConfiguration', {}).get('indexArn')
+    return (actual.get('embeddingModelArn') != desired['embeddingModelArn']
+            or dimensions(actual) != dimensions(desired)
+            or actual_index != vector_index_arn)
+
+@traced('knowledge_base', 'kb_name')
+def reconcile_bedrock_knowledge_base(bedrock_agent, kb_name, region, role_arn, vector_index_arn, changes, clock=None,
+                                     embedding_profile=None):
+    """Return (kb_id, created); update the role in place, recreate only if embeddings or storage changed"""
+    index = get_kb_index(bedrock_agent)
+    kb_id = index.knowledge_base_id(kb_name)
+    kb = kb_id and _describe(bedrock_agent.get_knowledge_base, knowledgeBaseId=kb_id)
+    if kb:
+        current = kb['knowledgeBase']
+        if _knowledge_base_drift(current, region, vector_index_arn, embedding_profile):
+            # Embedding model and vector store are fixed for the life of a KB
+            print(f"🔄 Knowledge Base embedding or storage configuration changed, recreating: {kb_name}")
+            clean_up_knowledgebase(bedrock_agent, kb_name, clock)
+            changes.append(f"recreated knowledge base {kb_name}")
+        else:
+            if current.get('roleArn') != role_arn:
+                bedrock_agent.update_knowledge_base(
+                    knowledgeBaseId=kb_id,
+                    name=kb_name,
+                    description=f"Knowledge base: {kb_name} using S3 Vectors",
+                    roleArn=role_arn,
+                    knowledgeBaseConfiguration=knowledge_base_configuration(region, embedding_profile),
+                    storageConfiguration=storage_configuration(vector_index_arn)
+                )
+                changes.append(f"updated role of knowledge base {kb_name}")
+            if current.get('status') != 'ACTIVE':
+                wait_for_knowledge_base_active(bedrock_agent, kb_id, clock)
+            print(f"✅ Knowledge Base up to date: {kb_id}")
+            return kb_id, False
+    else:
+        changes.append(f"created knowledge base {kb_name}")
+    return create_bedrock_knowledge_base(bedrock_agent, kb_name, region, role_arn, vector_index_arn, clock,
+                                         embedding_profile), True
+
+@traced('data_source', 'kb_name')
+def reconcile_data_source(bedrock_agent, kb_name, bucket_name, kb_id, needs_ingestion, changes, clock=None, wait=True,
+                          changed_keys=(), partitioned=False):
+    """Create or update the data source and ingest only if it or the documents changed
+
+    With partitioned=True, or for a KB created that way, the partitions of changed_keys are
+    ingested through their partition data sources instead.
+    """
+    ds_name = f"{kb_name}-datasource"
+    ds_id = find_data_source_id(bedrock_agent, kb_id, ds_name)
+    if partitioned and ds_id is not None:
+        raise ValueError(f"{kb_name} has a bucket-wide data source, partition data sources next to it would "
+                         f"ingest every document twice; reconcile it with partitioned=False")
+    existing = partition_data_sources(bedrock_agent, kb_name, kb_id) if ds_id is None else {}
+    if partitioned or existing:
+        # A bucket-wide data source next to the partition ones would ingest every document twice
+        partitions = {partition_of(key) for key in changed_keys}
+        check_partitions(kb_name, partitions, existing)
+        if not needs_ingestion or not partitions:
+            print(f"✅ Partition data sources up to date, skipping ingestion: {kb_name}")
+            return kb_id
+        jobs = ingest_partitions(bedrock_agent, kb_name, bucket_name, kb_id, partitions, clock, wait)
+        changes.append(f"started ingestion jobs for {len(jobs)} partitions")
+        return kb_id
+    if ds_id is None:
+        changes.append(f"created data source {ds_name}")
+        add_data_source_to_knowledge_base(bedrock_agent, kb_name, bucket_name, kb_id, clock, wait)
+        return kb_id
+
+    current = bedrock_agent.get_data_source(knowledgeBaseId=kb_id, dataSourceId=ds_id)['dataSource']
+    bucket_arn = current.get('dataSourceConfiguration', {}).get('s3Configuration', {}).get('bucketArn')
+    if bucket_arn != data_source_configuration(bucket_name)['s3Configuration']['bucketArn']:
+        bedrock_agent.update_data_source(
             knowledgeBaseId=kb_id,
             dataSourceId=ds_id,
-            ingestionJobId=job_id
+            name=ds_name,
+            description="S3 data source",
+            dataSourceConfiguration=data_source_configuration(bucket_name)
         )
-        status = job_status['ingestionJob']['status']
-        
+        changes.append(f"updated data source {ds_name}")
+        needs_ingestion = True
+    if not needs_ingestion:
+        print(f"✅ Data source up to date, skipping ingestion: {ds_id}")
+        return kb_id
+
+    job = start_ingestion(bedrock_agent, kb_id, ds_id, get_ingestion_monitor(clock))
+    changes.append(f"started ingestion job {job.job_id}")
+    if wait:
+        print("⏳ Waiting for ingestion to complete...")
+        follow_ingestion(job, kb_id)
+        print("✅ Ingestion completed successfully")
+    return kb_id
+
+def reconcile_knowledge_base(names, files, region="us-east-1", clock=None, upload_workers=8, manifest_path=None,
+                             delete_missing=False, wait=True, embedding_profile=None, metadata=None, lexical=False,
+                             tables=False, layout=None, hashes=None, partitioned=False):
+    """Bring a topic's bucket, documents, vector index, role, KB and data source(s) to the desired state"""
+    bedrock_agent = get_client('bedrock-agent', region)
+    s3 = get_client('s3', region)
+    s3vectors = get_client('s3vectors', region)
+    iam = get_client('iam', region)
+    changes = []
+    print(f"🔍 Reconciling Knowledge Base: {names.kb_name}")
+
+    create_s3_bucket(s3, names.bucket_name, region)
+    plan = sync_files(s3, names.bucket_name, files, manifest_path, delete_missing, upload_workers, clock, hashes)
+    upload_metadata(s3, names.bucket_name, document_metadata(plan.upload, metadata, layout), upload_workers)
+    if not plan.is_empty():
+        changes.append(f"synced documents ({len(plan.upload)} uploaded, {len(plan.delete)} deleted)")
+    vector_index_arn = reconcile_vector_index(s3vectors, bedrock_agent, region, names.account_id, names.vector_bucket_name,
+                                              names.vector_index_name, names.kb_name, changes, clock, embedding_profile)
+    role_arn = reconcile_bedrock_iam(iam, names.role_name, names.bucket_name, region, changes, clock, embedding_profile)
+    kb_id, created = reconcile_bedrock_knowledge_base(bedrock_agent, names.kb_name, region, role_arn, vector_index_arn,
+                                                      changes, clock, embedding_profile)
+    if lexical:
+        if created or get_lexical_index(kb_id) is None:
+            # A new KB has a new ID, so its index starts from every file rather than just the changed ones
+            index_documents_lexically(kb_id, files, names.bucket_name, document_metadata(files, metadata, layout), replace_all=True)
+        elif not plan.is_empty():
+            index_documents_lexically(kb_id, plan.upload, names.bucket_name, document_metadata(plan.upload, metadata, layout),
+                                      removed=plan.delete)
+    if tables:
+        if created or not table_measures(kb_id=kb_id):
+            index_harvest_tables(kb_id, files, metadata, replace_all=True, layout=layout)
+        elif not plan.is_empty():
+            index_harvest_tables(kb_id, plan.upload, metadata, removed=plan.delete, layout=layout)
+    # A new KB has to ingest every document, not just the ones that were uploaded
+    changed_keys = [target for _, target in files] if created else [target for _, target in plan.upload] + plan.delete
+    reconcile_data_source(bedrock_agent, names.kb_name, names.bucket_name, kb_id, created or not plan.is_empty(),
+                          changes, clock, wait, changed_keys, partitioned)
+
+    if changes:
+        print("📝 Changes:\n" + '\n'.join(f"  - {change}" for change in changes))
+    else:
+        print("✅ Nothing to do - deployment already matches")
+    return kb_id
+
+# Waiters - poll the real resource state with backoff instead of sleeping a fixed time
+class WaiterTimeout(Exception):
+    pass
+
+# Seconds each resource gets to become ready before we give up
+WAITER_DEADLINES = {
+    'vector_bucket': 120,
+    'vector_bucket_deleted': 120,
+    'vector_index': 120,
+    'vector_index_deleted': 120,
+    'role': 120,
+    'knowledge_base_active': 600,
+    'knowledge_base_deleted': 300,
+    'ingestion_job': 3600,
+    'documents': 900,
+}
+
+NOT_FOUND_CODES = ('NotFoundException', 'ResourceNotFoundException', 'NoSuchEntity', 'NoSuchBucket', '404')
+
+def _error_code(error):
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+def _is_role_not_ready(error):
+    message = str(error).lower()
+    return _error_code(error) == 'ValidationException' and ('role' in message or 'assume' in message)
+
+def wait_until(check, resource, clock=None, deadline=None, initial_delay=1.0, max_delay=15.0, backoff=2.0, jitter=0.2):
+    """Call check() until it returns something truthy, backing off exponentially with jitter"""
+    clock = clock or SYSTEM_CLOCK
+    if deadline is None:
+        deadline = WAITER_DEADLINES[resource]
+    give_up_at = clock.now() + deadline
+    delay = initial_delay
+    polls = 0
+    while True:
+        polls += 1
+        record(polls=1)
+        result = check()
+        if result:
+            return result
+        remaining = give_up_at - clock.now()
+        if remaining <= 0:
+            raise WaiterTimeout(f"Timed out after {deadline}s waiting for {resource} ({polls} polls)")
+        pause = min(delay, max_delay) * random.uniform(1 - jitter, 1 + jitter)
+        clock.sleep(min(pause, remaining))
+        delay *= backoff
+
+def _exists(call, **kwargs):
+    try:
+        call(**kwargs)
+        return True
+    except ClientError as e:
+        if _error_code(e) in NOT_FOUND_CODES:
+            return False
+        raise
+
+def wait_for_vector_bucket(s3vectors_client, vector_bucket_name, clock=None):
+    return wait_until(
+        lambda: _exists(s3vectors_client.get_vector_bucket, vectorBucketName=vector_bucket_name),
+        'vector_bucket', clock)
+
+def wait_for_vector_bucket_deleted(s3vectors_client, vector_bucket_name, clock=None):
+    return wait_until(
+        lambda: not _exists(s3vectors_client.get_vector_bucket, vectorBucketName=vector_bucket_name),
+        'vector_bucket_deleted', clock)
+
+def wait_for_vector_index(s3vectors_client, vector_bucket_name, vector_index_name, clock=None):
+    return wait_until(
+        lambda: _exists(s3vectors_client.get_index, vectorBucketName=vector_bucket_name, indexName=vector_index_name),
+        'vector_index', clock)
+
+def wait_for_vector_index_deleted(s3vectors_client, vector_bucket_name, vector_index_name, clock=None):
+    return wait_until(
+        lambda: not _exists(s3vectors_client.get_index, vectorBucketName=vector_bucket_name, indexName=vector_index_name),
+        'vector_index_deleted', clock)
+
+def wait_for_role(iam_client, role_name, clock=None):
+    """Wait until IAM returns both the role and its inline permissions policy"""
+    return wait_until(
+        lambda: _exists(iam_client.get_role, RoleName=role_name)
+        and _exists(iam_client.get_role_policy, RoleName=role_name, PolicyName=f"{role_name}-permissions"),
+        'role', clock)
+
+def wait_for_knowledge_base_active(bedrock_agent, kb_id, clock=None):
+    def check():
+        kb_status = bedrock_agent.get_knowledge_base(knowledgeBaseId=kb_id)
+        status = kb_status['knowledgeBase']['status']
+        if status == 'FAILED':
+            raise Exception(f"Knowledge Base creation failed: {kb_status}")
+        return status == 'ACTIVE'
+    return wait_until(check, 'knowledge_base_active', clock)
+
+def wait_for_knowledge_base_deleted(bedrock_agent, kb_id, clock=None):
+    def check():
+        try:
+            kb_status = bedrock_agent.get_knowledge_base(knowledgeBaseId=kb_id)
+        except ClientError as e:
+            if _error_code(e) in NOT_FOUND_CODES:
+                return True
+            raise
+        if kb_status['knowledgeBase']['status'] == 'DELETE_UNSUCCESSFUL':
+            raise Exception(f"Knowledge Base deletion failed: {kb_status}")
+        return False
+    return wait_until(check, 'knowledge_base_deleted', clock)
+
+# Ingestion jobs - start_ingestion() hands back a job handle right away, and one background
+# monitor polls every outstanding job in a single loop with per-job backoff and a shared
+# request budget, so callers (and agent tools) are not tied up for the whole ingestion.
+# Every poll also becomes an IngestionProgress snapshot of the job's statistics
+INGESTION_STATISTICS = {    # IngestionProgress field -> get_ingestion_job statistics key
+    'scanned': 'numberOfDocumentsScanned',
+    'metadata_scanned': 'numberOfMetadataDocumentsScanned',
+    'indexed': 'numberOfNewDocumentsIndexed',
+    'modified': 'numberOfModifiedDocumentsIndexed',
+    'metadata_modified': 'numberOfMetadataDocumentsModified',
+    'deleted': 'numberOfDocumentsDeleted',
+    'skipped': 'numberOfDocumentsSkipped',
+    'failed': 'numberOfDocumentsFailed',
+}
+
+class IngestionProgress(namedtuple('IngestionProgress', ['kb_id', 'job_id', 'status', 'elapsed', 'docs_per_second',
+                                                         'eta'] + list(INGESTION_STATISTICS))):
+    """One poll of a job: its statistics, documents processed per second so far and the seconds left (None if unknown)"""
+    @property
+    def processed(self):
+        return self.indexed + self.modified + self.deleted + self.skipped + self.failed
+
+    def describe(self):
+        eta = f", ~{self.eta:.0f}s left" if self.eta is not None else ""
+        return (f"📈 {self.kb_id} {self.status}: {self.scanned} scanned, {self.indexed + self.modified} indexed, "
+                f"{self.deleted} deleted, {self.failed} failed ({self.docs_per_second:.1f} docs/s{eta})")
+
+class IngestionReport(namedtuple('IngestionReport', ['kb_id', 'ds_id', 'job_id', 'status', 'seconds', 'polls',
+                                                     'docs_per_second', 'failure_reasons'] + list(INGESTION_STATISTICS))):
+    """Final statistics of an ingestion job"""
+    def summary(self):
+        lines = [f"📊 Ingestion {self.job_id} {self.status} in {self.seconds:.1f}s ({self.polls} polls): "
+                 f"{self.scanned} scanned, {self.indexed} new, {self.modified} modified, {self.deleted} deleted, "
+                 f"{self.skipped} skipped, {self.failed} failed - {self.docs_per_second:.1f} docs/s"]
+        lines.extend(f"  ❌ {reason}" for reason in self.failure_reasons)
+        return '\n'.join(lines)
+
+def _statistics(description):
+    statistics = (description or {}).get('statistics', {})
+    return {field: statistics.get(key, 0) for field, key in INGESTION_STATISTICS.items()}
+
+def _job_seconds(description):
+    started, updated = (description or {}).get('startedAt'), (description or {}).get('updatedAt')
+    if hasattr(started, 'timestamp') and hasattr(updated, 'timestamp'):
+        return max((updated - started).total_seconds(), 0.0)
+    return None
+
+class IngestionJob:
+    """Handle for a running ingestion job - poll it, block on result(), await it, add callbacks or follow its progress()"""
+    def __init__(self, bedrock_agent, kb_id, ds_id, job_id, expected_documents=None):
+        self.bedrock_agent = bedrock_agent
+        self.kb_id = kb_id
+        self.ds_id = ds_id
+        self.job_id = job_id
+        self.expected_documents = expected_documents  # ETA basis; the scanned count when None
+        self.status = 'STARTING'
+        self.description = None  # last get_ingestion_job response body
+        self.polls = 0
+        self.snapshots = []      # IngestionProgress per poll
+        self.clock = SYSTEM_CLOCK
+        self.started_at = self.clock.now()
+        self._future = Future()
+        self._updated = threading.Condition()
+        self._listeners = []
+        self._future.add_done_callback(lambda _: self._notify())
+
+    def _notify(self):
+        with self._updated:
+            self._updated.notify_all()
+            listeners = list(self._listeners)
+        for fn in listeners:
+            fn()
+
+    def _record(self, description):
+        """Turn a get_ingestion_job response into the next snapshot"""
+        statistics = _statistics(description)
+        elapsed = _job_seconds(description) or (self.clock.now() - self.started_at)
+        processed = sum(statistics[field] for field in ('indexed', 'modified', 'deleted', 'skipped', 'failed'))
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        total = self.expected_documents or statistics['scanned']
+        eta = (total - processed) / rate if rate > 0 and total > processed else None
+        snapshot = IngestionProgress(self.kb_id, self.job_id, description['status'], elapsed, rate, eta, **statistics)
+        with self._updated:
+            self.snapshots.append(snapshot)
+        self._notify()
+        return snapshot
+
+    def progress(self):
+        """Yield every IngestionProgress snapshot (past and future) until the job finishes; returns its report()"""
+        seen = 0
+        while True:
+            with self._updated:
+                self._updated.wait_for(lambda: len(self.snapshots) > seen or self.done())
+                new = self.snapshots[seen:]
+                seen = len(self.snapshots)
+                finished = self.done()
+            yield from new
+            if finished:
+                return self.report()
+
+    async def aprogress(self):
+        """Async iterator over the same snapshots as progress(); the report is job.report() afterwards"""
+        loop = asyncio.get_running_loop()
+        updated = asyncio.Event()
+        wake = lambda: loop.call_soon_threadsafe(updated.set)
+        with self._updated:
+            self._listeners.append(wake)
+        try:
+            seen = 0
+            while True:
+                updated.clear()
+                with self._updated:
+                    new = self.snapshots[seen:]
+                    seen = len(self.snapshots)
+                    finished = self.done()
+                for snapshot in new:
+                    yield snapshot
+                if finished:
+                    return
+                await updated.wait()
+        finally:
+            with self._updated:
+                self._listeners.remove(wake)
+
+    def report(self):
+        """IngestionReport from the latest poll"""
+        last = self.snapshots[-1] if self.snapshots else None
+        statistics = _statistics(self.description)
+        return IngestionReport(self.kb_id, self.ds_id, self.job_id, self.status,
+                               last.elapsed if last else self.clock.now() - self.started_at, self.polls,
+                               last.docs_per_second if last else 0.0,
+                               list((self.description or {}).get('failureReasons', [])), **statistics)
+
+    def failed_documents(self):
+        """DocumentResults for the documents of this data source that failed to ingest"""
+        failed = []
+        paginator = self.bedrock_agent.get_paginator('list_knowledge_base_documents')
+        for page in paginator.paginate(knowledgeBaseId=self.kb_id, dataSourceId=self.ds_id):
+            for detail in page.get('documentDetails', []):
+                if detail.get('status') in DOCUMENT_FAILED_STATUSES:
+                    identifier = detail.get('identifier', {})
+                    key = identifier.get('s3', {}).get('uri') or identifier.get('custom', {}).get('id')
+                    failed.append(DocumentResult(key, 'ingest', detail['status'], detail.get('statusReason')))
+        return failed
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        """Block until the job finishes and return its final description; raises if it failed"""
+        return self._future.result(timeout)
+
+    def exception(self, timeout=None):
+        return self._future.exception(timeout)
+
+    def add_done_callback(self, fn):
+        """Call fn(job) once the job finishes (immediately if it already has)"""
+        self._future.add_done_callback(lambda _: fn(self))
+
+    def __await__(self):
+        return asyncio.wrap_future(self._future).__await__()
+
+    def __repr__(self):
+        return f"IngestionJob(kb_id={self.kb_id!r}, ds_id={self.ds_id!r}, job_id={self.job_id!r}, status={self.status!r})"
+
+class _Watch:
+    def __init__(self, job, next_poll_at, delay, give_up_at):
+        self.job = job
+        self.next_poll_at = next_poll_at
+        self.delay = delay
+        self.give_up_at = give_up_at
+
+class IngestionMonitor:
+    """Single scheduler loop that polls all outstanding ingestion jobs across knowledge bases"""
+    def __init__(self, clock=None, max_polls_per_second=2.0, initial_delay=2.0, max_delay=30.0,
+                 backoff=1.5, jitter=0.2, deadline=None):
+        self.clock = clock or SYSTEM_CLOCK
+        self.max_polls_per_second = max_polls_per_second
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.deadline = deadline if deadline is not None else WAITER_DEADLINES['ingestion_job']
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._watches = []
+        self._thread = None
+        self._budget = max_polls_per_second
+        self._budget_updated_at = self.clock.now()
+
+    def watch(self, job):
+        """Start tracking a job; the background loop is started on demand"""
+        now = self.clock.now()
+        job.clock, job.started_at = self.clock, now
+        with self._lock:
+            self._watches.append(_Watch(job, now + self.initial_delay, self.initial_delay, now + self.deadline))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ingestion-monitor', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return job
+
+    def jobs(self, kb_id=None):
+        """Outstanding jobs, optionally only those for one knowledge base"""
+        with self._lock:
+            return [w.job for w in self._watches if kb_id is None or w.job.kb_id == kb_id]
+
+    def _take_budget(self, wanted):
+        now = self.clock.now()
+        self._budget = min(self.max_polls_per_second,
+                           self._budget + (now - self._budget_updated_at) * self.max_polls_per_second)
+        self._budget_updated_at = now
+        granted = min(wanted, int(self._budget))
+        self._budget -= granted
+        return granted
+
+    def run_pending(self):
+        """Poll every job that is due (within the budget); return seconds until the next poll, or None if idle"""
+        now = self.clock.now()
+        with self._lock:
+            due = sorted((w for w in self._watches if w.next_poll_at <= now), key=lambda w: w.next_poll_at)
+            due = due[:self._take_budget(len(due))]
+        for watch in due:
+            self._poll(watch)
+        with self._lock:
+            self._watches = [w for w in self._watches if not w.job.done()]
+            if not self._watches:
+                return None
+            wait = min(w.next_poll_at for w in self._watches) - self.clock.now()
+            if self._budget < 1:
+                wait = max(wait, (1 - self._budget) / self.max_polls_per_second)
+            return max(wait, 0.0)
+
+    def _reschedule(self, watch, factor=1.0):
+        watch.delay = min(watch.delay * self.backoff * factor, self.max_delay)
+        watch.next_poll_at = self.clock.now() + watch.delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _poll(self, watch):
+        job = watch.job
+        try:
+            response = job.bedrock_agent.get_ingestion_job(
+                knowledgeBaseId=job.kb_id,
+                dataSourceId=job.ds_id,
+                ingestionJobId=job.job_id
+            )
+        except ClientError as e:
+            if _error_code(e) in THROTTLING_CODES:
+                self._reschedule(watch, factor=2.0)
+                return
+            job._future.set_exception(e)
+            return
+        except Exception as e:
+            job._future.set_exception(e)
+            return
+        job.polls += 1
+        job.description = response['ingestionJob']
+        status = job.description['status']
+        if status != job.status:
+            print(f"⏳ Ingestion status for {job.kb_id}: {status}")
+            job.status = status
+        job._record(job.description)
         if status == 'COMPLETE':
-            print("✅ Ingestion completed successfully")
-            break
-        elif status == 'FAILED':
-            failure_reasons = job_status['ingestionJob'].get('failureReasons', ['Unknown error'])
-            raise Exception(f"Ingestion failed: {failure_reasons}")
-        elif status in ['IN_PROGRESS', 'STARTING']:
-            print(f"⏳ Ingestion status: {status}")
-            time.sleep(15)
+            job._future.set_result(job.description)
+        elif status in ('FAILED', 'STOPPED'):
+            failure_reasons = job.description.get('failureReasons', ['Unknown error'])
+            job._future.set_exception(Exception(f"Ingestion failed: {failure_reasons}"))
+        elif self.clock.now() >= watch.give_up_at:
+            job._future.set_exception(WaiterTimeout(
+                f"Timed out after {self.deadline}s waiting for ingestion job {job.job_id} ({job.polls} polls)"))
         else:
-            print(f"❓ Unexpected status: {status}")
-            time.sleep(10)
-    return kb_id
+            self._reschedule(watch)
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                wait = self.run_pending()
+            except Exception as e:
+                print(f"❌ Ingestion monitor error: {e}")
+                wait = self.initial_delay
+            with self._lock:
+                if wait is None and not self._watches:
+                    self._thread = None
+                    return
+            self.clock.wait(self._wakeup, wait if wait is not None else 0.0)
+
+_monitors = {}
 
+def get_ingestion_monitor(clock=None):
+    """Return the process-wide monitor for a clock (the system clock by default)"""
+    clock = clock or SYSTEM_CLOCK
+    with _clients_lock:
+        monitor = _monitors.get(id(clock))
+        if monitor is None or monitor.clock is not clock:
+            monitor = IngestionMonitor(clock)
+            _monitors[id(clock)] = monitor
+        return monitor
+
+def start_ingestion(bedrock_agent, kb_id, ds_id, monitor=None):
+    """Start an ingestion job and return its IngestionJob handle without waiting for it"""
+    print("🔄 Starting ingestion job...")
+    job_response = bedrock_agent.start_ingestion_job(
+        knowledgeBaseId=kb_id,
+        dataSourceId=ds_id
+    )
+    job_id = job_response['ingestionJob']['ingestionJobId']
+    job = IngestionJob(bedrock_agent, kb_id, ds_id, job_id)
+    job.add_done_callback(lambda finished: notify_knowledge_base_changed(finished.kb_id))
+    report = _current_report.get()
+    if report is not None:
+        report.add_ingestion_job(job)
+    return (monitor or get_ingestion_monitor()).watch(job)
+
+def follow_ingestion(job, resource=None):
+    """Wait for job in an 'ingestion' span, printing its statistics as they change; returns its IngestionReport"""
+    with span('ingestion', resource or job.kb_id):
+        try:
+            previous = None
+            for snapshot in job.progress():
+                counts = tuple(getattr(snapshot, field) for field in INGESTION_STATISTICS)
+                if counts != previous and any(counts):
+                    print(snapshot.describe())
+                previous = counts
+            job.result()
+        finally:
+            record(polls=job.polls)
+    report = job.report()
+    print(report.summary())
+    return report
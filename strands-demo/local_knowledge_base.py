@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import faiss
+import numpy as np
+from knowledge_base_management import KnowledgeBaseBackend, plan_sync, save_manifest
+from lexical_index import chunk_text, extract_text, matches_filter, tokenize
+
+# Local knowledge base engine - same create/update/find/query surface as the Bedrock + S3 Vectors
+# path in knowledge_base_management.py, but chunks, embeds and searches in-process with an
+# on-disk FAISS index so dev iterations don't pay for cloud provisioning and ingestion
+LOCAL_KB_ROOT = os.environ.get('LOCAL_KB_ROOT', os.path.join(os.path.expanduser('~'), '.strands_local_kb'))
+
+class HashingEmbedder:
+    """Deterministic offline embedder - signed feature hashing of words and word pairs"""
+    def __init__(self, dimension=512):
+        self.dimension = dimension
+
+    def _slot(self, feature):
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        return value % self.dimension, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for feature in tokens + [a + ' ' + b for a, b in zip(tokens, tokens[1:])]:
+                slot, sign = self._slot(feature)
+                vectors[row, slot] += sign
+        faiss.normalize_L2(vectors)
+        return vectors
+
+class LocalKnowledgeBase:
+    """One topic's chunks plus their FAISS index, persisted under root/kb_id"""
+    def __init__(self, path, embedder):
+        self.path = path
+        self.embedder = embedder
+        self.chunks = {}  # chunk id -> {'text', 'target', 'source', 'metadata'}
+        self.hashes = {}  # target -> sha256 of the file it was indexed from, the local sync manifest
+        self.next_id = 0
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(embedder.dimension))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, embedder):
+        kb = cls(path, embedder)
+        with open(os.path.join(path, 'chunks.json')) as f:
+            stored = json.load(f)
+        if stored['dimension'] != embedder.dimension:
+            raise ValueError(f"{path} was built with dimension {stored['dimension']}, embedder has {embedder.dimension}")
+        kb.chunks = {int(chunk_id): chunk for chunk_id, chunk in stored['chunks'].items()}
+        kb.next_id = stored['next_id']
+        kb.hashes = stored.get('hashes', {})
+        kb.index = faiss.read_index(os.path.join(path, 'index.faiss'))
+        return kb
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(self.path, 'index.faiss'))
+        tmp_path = os.path.join(self.path, 'chunks.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'dimension': self.embedder.dimension, 'next_id': self.next_id,
+                       'chunks': self.chunks, 'hashes': self.hashes}, f)
+        os.replace(tmp_path, os.path.join(self.path, 'chunks.json'))
+
+    def _drop(self, target):
+        stale = [chunk_id for chunk_id, chunk in self.chunks.items() if chunk['target'] == target]
+        if stale:
+            self.index.remove_ids(np.array(stale, dtype='int64'))
+            for chunk_id in stale:
+                del self.chunks[chunk_id]
+        self.hashes.pop(target, None)
+
+    def add_files(self, files, metadata=None, hashes=None, remove=()):
+        """Index (source, target) pairs, replacing anything previously indexed for the same target
+
+        metadata optionally maps a target to attributes (state, animal, year, ...) that filters can match.
+        hashes ({target: sha256}) is recorded so later updates can skip unchanged files; the targets
+        in remove are dropped from the index.
+        """
+        with self._lock:
+            for target in remove:
+                self._drop(target)
+            for source, target in files:
+                self._drop(target)
+                if hashes and target in hashes:
+                    self.hashes[target] = hashes[target]
+                texts = chunk_text(extract_text(source))
+                if not texts:
+                    continue
+                ids = np.arange(self.next_id, self.next_id + len(texts), dtype='int64')
+                self.index.add_with_ids(self.embedder.embed(texts), ids)
+                for chunk_id, text in zip(ids.tolist(), texts):
+                    self.chunks[chunk_id] = {'text': text, 'target': target, 'source': source,
+                                             'metadata': dict((metadata or {}).get(target, {}),
+                                                              **{'x-amz-bedrock-kb-source-uri': target})}
+                self.next_id += len(texts)
+            self.save()
+
+    def query(self, text, top_k=5, filters=None):
+        """Top-k chunks in the same shape as bedrock-agent-runtime retrieve()'s retrievalResults"""
+        with self._lock:
+            if self.index.ntotal == 0:
+                return []
+            # Over-fetch when filtering so the filter doesn't starve the result list
+            k = self.index.ntotal if filters else min(top_k, self.index.ntotal)
+            scores, ids = self.index.search(self.embedder.embed([text]), k)
+            results = []
+            for score, chunk_id in zip(scores[0].tolist(), ids[0].tolist()):
+                chunk = self.chunks.get(chunk_id)
+                if chunk is None or not matches_filter(chunk['metadata'], filters):
+                    continue
+                results.append({
+                    'content': {'text': chunk['text']},
+                    'location': {'type': 'CUSTOM', 'customDocumentLocation': {'id': chunk['target']}},
+                    'metadata': dict(chunk['metadata']),
+                    'score': score,
+                })
+                if len(results) == top_k:
+                    break
+            return results
+
+class LocalBackend(KnowledgeBaseBackend):
+    """Knowledge base backend that keeps everything on local disk"""
+    name = 'local'
+
+    # What create/update honour here; the Bedrock-only ones (direct, partitioned, reconcile,
+    # wait=False, ...) have no local equivalent, so they fail instead of being silently ignored
+    OPTIONS = {'metadata', 'incremental', 'manifest_path', 'delete_missing'}
+
+    def __init__(self, root=LOCAL_KB_ROOT, embedder=None):
+        self.root = root
+        self.embedder = embedder or HashingEmbedder()
+        self._kbs = {}
+        self._lock = threading.Lock()
+
+    def _kb_id(self, topic_base):
+        return f"local-{topic_base}"
+
+    def _open(self, kb_id):
+        with self._lock:
+            kb = self._kbs.get(kb_id)
+            if kb is None:
+                path = os.path.join(self.root, kb_id)
+                if not os.path.exists(os.path.join(path, 'chunks.json')):
+                    raise KeyError(f"Local knowledge base not found: {kb_id}")
+                kb = self._kbs[kb_id] = LocalKnowledgeBase.load(path, self.embedder)
+            return kb
+
+    def _check_options(self, options):
+        unsupported = sorted(set(options) - self.OPTIONS)
+        if unsupported:
+            raise TypeError(f"The local backend doesn't support {', '.join(unsupported)}")
+
+    def _sync(self, kb, files, metadata=None, incremental=False, manifest_path=None, delete_missing=False):
+        """Index files into kb - only the changed ones when incremental - and drop what's gone if delete_missing"""
+        plan = plan_sync(kb.hashes, files, delete_missing)
+        if incremental:
+            print(f"🔍 Sync plan for {kb.path}: {len(plan.upload)} to index, "
+                  f"{len(plan.delete)} to delete, {len(plan.unchanged)} unchanged")
+        kb.add_files(plan.upload if incremental else files, metadata, plan.hashes, plan.delete)
+        if manifest_path:
+            save_manifest(manifest_path, kb.hashes)
+
+    def create(self, topic_base, files, region=None, **options):
+        self._check_options(options)
+        kb_id = self._kb_id(topic_base)
+        path = os.path.join(self.root, kb_id)
+        print(f"🚀 Creating local Knowledge Base: {kb_id}")
+        with self._lock:
+            shutil.rmtree(path, ignore_errors=True)
+            kb = self._kbs[kb_id] = LocalKnowledgeBase(path, self.embedder)
+        self._sync(kb, files, **options)
+        print(f"✅ Indexed {len(kb.chunks)} chunks from {len(files)} files into {path}")
+        return kb_id
+
+    def update(self, topic_base, files, kb_id, region=None, **options):
+        self._check_options(options)
+        kb = self._open(kb_id)
+        self._sync(kb, files, **options)
+        print(f"✅ Local Knowledge Base updated: {kb_id} ({len(kb.chunks)} chunks)")
+        return kb_id
+
+    def find(self, topic_base, region=None):
+        kb_id = self._kb_id(topic_base)
+        if kb_id in self._kbs or os.path.exists(os.path.join(self.root, kb_id, 'chunks.json')):
+            return kb_id
+        return None
+
+    def query(self, kb_id, query, top_k=5, region=None, filters=None):
+        return self._open(kb_id).query(query, top_k, filters)
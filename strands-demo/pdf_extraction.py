@@ -0,0 +1,178 @@
+import hashlib
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# PDF pre-extraction - turns harvest report PDFs into compact markdown (page text plus tables)
+# across all CPU cores before upload, so S3 and the ingestion job handle a fraction of the bytes
+# and chunking sees clean text instead of whatever the PDF parser makes of a scanned table.
+# pypdf is required; pdfplumber (in requirements.txt) is used for tables when installed, otherwise
+# tables are recovered from pypdf's layout mode: runs of lines whose cells start or end at the
+# same columns. Anything else, justified prose included, stays text.
+EXTRACTED_CACHE_DIR = os.environ.get('EXTRACTED_CACHE_DIR', 'extracted_cache')
+MIN_TEXT_CHARS = 200   # less than this per document means a scan without a text layer
+RUNNING_LINES = 1      # lines at the top and bottom of a page checked for running headers/footers
+COLUMN_TOLERANCE = 2   # characters a cell may drift from the one above it and still be the same column
+
+LAYOUT_CELL = re.compile(r'\S+(?: \S+)*')   # text between runs of 2+ spaces
+
+def _pdf_reader(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError("PDF pre-extraction requires pypdf (pip install pypdf)")
+    return PdfReader(path)
+
+def _markdown_table(rows):
+    width = max(len(row) for row in rows)
+    rows = [[cell.replace('|', '/').strip() for cell in row] + [''] * (width - len(row)) for row in rows]
+    lines = ['| ' + ' | '.join(rows[0]) + ' |', '|' + ' --- |' * width]
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+    return '\n'.join(lines)
+
+def _layout_cells(line):
+    """(start, end, text) of every cell of a layout-mode line"""
+    return [(m.start(), m.end(), m.group()) for m in LAYOUT_CELL.finditer(line)]
+
+def _aligned(cells, previous, tolerance=COLUMN_TOLERANCE):
+    # Same number of columns, each starting (left-aligned) or ending (right-aligned numbers) where the one above does
+    return len(cells) == len(previous) and all(
+        abs(cell[0] - above[0]) <= tolerance or abs(cell[1] - above[1]) <= tolerance
+        for cell, above in zip(cells, previous))
+
+def layout_to_markdown(text):
+    """Collapse runs of column-aligned lines (3+ cells) into markdown tables, keep the rest as text"""
+    output, table = [], []   # table: [(line, cells)] of the current run
+    def flush():
+        if len(table) >= 2:
+            output.append(_markdown_table([[cell[2] for cell in cells] for _, cells in table]))
+        else:
+            output.extend(' '.join(line.split()) for line, _ in table)
+        table.clear()
+    for line in text.splitlines():
+        cells = _layout_cells(line)
+        if len(cells) >= 3 and table and _aligned(cells, table[-1][1]):
+            table.append((line, cells))
+            continue
+        flush()
+        if len(cells) >= 3:
+            table.append((line, cells))
+        else:
+            output.append(' '.join(line.split()))
+    flush()
+    return '\n'.join(output)
+
+def _page_tables(path):
+    """Markdown tables per page from pdfplumber, or None when it isn't installed"""
+    try:
+        import pdfplumber
+    except ImportError:
+        return None
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            tables = [t for t in page.extract_tables() if t and len(t) >= 2]
+            pages.append([_markdown_table([[cell or '' for cell in row] for row in t]) for t in tables])
+    return pages
+
+def _edge_lines(page, count=RUNNING_LINES):
+    lines = [line for line in page.splitlines() if line.strip() and not line.startswith('|')]
+    return set(lines[:count] + lines[-count:])
+
+def _drop_running_lines(pages):
+    # Headers/footers repeated on most pages add tokens to every chunk and carry no information
+    if len(pages) < 3:
+        return pages
+    edges = [_edge_lines(page) for page in pages]
+    counts = Counter(line for page_edges in edges for line in page_edges)
+    repeated = {line for line, count in counts.items() if count > len(pages) / 2}
+    return ['\n'.join(line for line in page.splitlines() if line not in repeated or line not in page_edges)
+            for page, page_edges in zip(pages, edges)]
+
+def _normalize(text):
+    text = re.sub(r'(\w)-\n(\w)', r'\1\2', text)    # words hyphenated across lines
+    text = re.sub(r'[ \t]+', ' ', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+def pdf_to_markdown(path):
+    """Markdown for one PDF: a section per page with its text and tables"""
+    reader = _pdf_reader(path)
+    tables = _page_tables(path)
+    pages = []
+    for number, page in enumerate(reader.pages):
+        if tables is None:
+            body = layout_to_markdown(page.extract_text(extraction_mode='layout') or '')
+        else:
+            body = '\n\n'.join([_normalize(page.extract_text() or '')] + tables[number])
+        pages.append(body)
+    pages = _drop_running_lines(pages)
+    title = os.path.splitext(os.path.basename(path))[0]
+    sections = [f"## Page {number}\n\n{_normalize(body)}" for number, body in enumerate(pages, 1) if body.strip()]
+    return f"# {title}\n\n" + '\n\n'.join(sections) + '\n'
+
+def _source_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def extract_document(source, cache_dir=EXTRACTED_CACHE_DIR):
+    """Write source's markdown into the cache (keyed by content hash); returns its path, or None for scans"""
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(source))[0]
+    path = os.path.join(cache_dir, f"{name}-{_source_hash(source)}.md")
+    if os.path.exists(path):
+        return path if os.path.getsize(path) else None
+    markdown = pdf_to_markdown(source)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        # An empty file remembers that this PDF has no text layer
+        f.write(markdown if len(markdown) >= MIN_TEXT_CHARS else '')
+    os.replace(path + '.tmp', path)
+    return path if len(markdown) >= MIN_TEXT_CHARS else None
+
+def _extract(args):
+    source, cache_dir = args
+    try:
+        return extract_document(source, cache_dir), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def markdown_target(target):
+    return os.path.splitext(target)[0] + '.md'
+
+def preprocess_files(files, mode='replace', max_workers=None, cache_dir=EXTRACTED_CACHE_DIR):
+    """Swap (or, with mode='alongside', pair) PDFs in a files list with their extracted markdown
+
+    Returns (files, targets) where targets maps each new markdown target to its original target.
+    PDFs without a text layer or that fail to parse are kept as they are.
+    """
+    if mode not in ('replace', 'alongside'):
+        raise ValueError(f"Unknown pre-extraction mode {mode!r}, expected 'replace' or 'alongside'")
+    files = list(files)
+    pdfs = [(source, target) for source, target in files if source.lower().endswith('.pdf')]
+    if not pdfs:
+        return files, {}
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(pdfs)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        extracted = dict(zip(pdfs, pool.map(_extract, [(source, cache_dir) for source, _ in pdfs])))
+
+    result, targets = [], {}
+    raw_bytes = derived_bytes = 0
+    for source, target in files:
+        path, error = extracted.get((source, target), (None, None))
+        if path is None:
+            if error:
+                print(f"⚠️  Could not extract {source}, uploading the PDF: {error}")
+            result.append((source, target))
+            continue
+        raw_bytes += os.path.getsize(source)
+        derived_bytes += os.path.getsize(path)
+        if mode == 'alongside':
+            result.append((source, target))
+        result.append((path, markdown_target(target)))
+        targets[markdown_target(target)] = target
+    print(f"📝 Extracted {len(targets)}/{len(pdfs)} PDFs to markdown with {workers} processes "
+          f"({raw_bytes / (1024 * 1024):.1f} MB -> {derived_bytes / (1024 * 1024):.1f} MB)")
+    return result, targets